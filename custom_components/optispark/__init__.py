@@ -9,8 +9,10 @@ from __future__ import annotations
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from .api import OptisparkApiClient
+from .configuration_service import config_service
 from .const import DOMAIN, LOGGER
 from custom_components.optispark.domain.address.address import Address
 
@@ -36,6 +38,17 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         country=entry.data["country"]
     )
 
+    # The entities read the heat pump entities straight away, the first refresh used to wait
+    # for them.  Home Assistant retries the setup until their integrations have loaded
+    for entity_id in (entry.data["climate_entity_id"], entry.data["heat_pump_power_entity_id"]):
+        try:
+            get_entity(hass, entity_id)
+        except OptisparkGetEntityError as err:
+            raise ConfigEntryNotReady(f"{entity_id} isn't available yet") from err
+
+    # The services read the backend configuration when the client is created
+    await config_service.async_load(hass)
+
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.entry_id] = coordinator = OptisparkDataUpdateCoordinator(
         hass=hass,
@@ -54,26 +67,32 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         city=entry.data["city"],
         country=entry.data["country"],
     )
-    # https://developers.home-assistant.io/docs/integration_fetching_data#coordinated-single-api-poll-for-data-for-all-entities
-    await coordinator.async_config_entry_first_refresh()
-
+    # The entities start from the snapshot saved after the last refresh, if there is one
+    await coordinator.async_restore_warm_start()
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     entry.async_on_unload(entry.add_update_listener(async_reload_entry))
 
+    # https://developers.home-assistant.io/docs/integration_fetching_data#coordinated-single-api-poll-for-data-for-all-entities
+    # The first refresh talks to the backend and uploads history, it runs in the background so
+    # that Home Assistant's startup doesn't wait for it.  Failures are retried on the next update.
+    entry.async_create_background_task(
+        hass, coordinator.async_refresh(), "optispark first refresh"
+    )
+
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Handle removal of an entry."""
     if unloaded := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
-        hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator = hass.data[DOMAIN].pop(entry.entry_id)
+        await coordinator.async_shutdown()
     return unloaded
 
 
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload config entry."""
-    await async_unload_entry(hass, entry)
-    await async_setup_entry(hass, entry)
+    await hass.config_entries.async_reload(entry.entry_id)
 
 
 class OptisparkGetEntityError(Exception):
@@ -23,6 +23,8 @@ from .backend.device.device_service import DeviceService
 from .backend.device.model.device_data_request import DeviceDataRequest
 from .backend.device.model.device_request import DeviceRequest
 from .backend.device.model.device_response import DeviceResponse
+from .backend.exception.exceptions import OptisparkApiClientThermostatError
+from .backend.history.history_service import HistoryService
 from .backend.location.location_service import LocationService
 from .backend.location.model.location_request import (
     LocationRequest,
@@ -42,34 +44,173 @@ from .utils import to_thermostat_info
 BACKEND_URL = "backend.url"
 
 
+def _float_to_decimal(obj):
+    # float() first, subclasses such as np.float64 have a repr/str that Decimal can't parse
+    return Decimal(str(float(obj)))
+
+
+def _datetime_to_decimal(obj):
+    return Decimal(repr(obj.timestamp()))
+
+
+def _identity(obj):
+    return obj
+
+
+# Converters for values that don't contain other values
+_SCALAR_CONVERTERS = {
+    float: _float_to_decimal,
+    int: _identity,
+    bool: _identity,
+    str: _identity,
+    type(None): _identity,
+    Decimal: _identity,
+    datetime: _datetime_to_decimal,
+}
+# Containers, the value is the type the converted container is finalised as
+_CONTAINER_TYPES = {
+    dict: dict,
+    list: list,
+    tuple: tuple,
+    set: set,
+    frozenset: frozenset,
+}
+
+
+def _dispatch(obj_type):
+    """Find how to convert obj_type.
+
+    Subclasses of supported types (e.g. ReadOnlyDict, StrEnum) are resolved through their MRO and
+    added to the dispatch tables so the lookup is only done once per type.
+    """
+    for base in obj_type.__mro__:
+        if base in _SCALAR_CONVERTERS:
+            _SCALAR_CONVERTERS[obj_type] = _SCALAR_CONVERTERS[base]
+            return
+        if base in _CONTAINER_TYPES:
+            _CONTAINER_TYPES[obj_type] = _CONTAINER_TYPES[base]
+            return
+    LOGGER.error(f"Object of type {obj_type} not supported by DynamoDB")
+    raise TypeError(f"Object of type {obj_type} not supported by DynamoDB")
+
+
+def is_columnar_payload(obj) -> bool:
+    """Check if obj is a columnar history payload, these contain no floats to convert."""
+    return isinstance(obj, dict) and obj.get("format") == const.HISTORY_PAYLOAD_FORMAT
+
+
 def floats_to_decimal(obj):
-    """Convert data types to those supported by DynamoDB."""
-    # Base cases
-    if isinstance(obj, float):
-        return Decimal(str(obj))
-    elif isinstance(obj, int):
-        return obj
-    elif isinstance(obj, str):
+    """Convert data types to those supported by DynamoDB.
+
+    Works with an explicit stack instead of recursion, so the nesting depth is not limited by the
+    recursion limit.  Every value is visited once and written straight into its converted
+    container.  Columnar history payloads are returned as is.
+    """
+    if is_columnar_payload(obj):
         return obj
-    elif obj is None:
-        return None
-    # Go deeper
-    elif isinstance(obj, dict):
-        return {
-            floats_to_decimal(key): floats_to_decimal(value)
-            for key, value in obj.items()
+    scalar_converters = _SCALAR_CONVERTERS
+    container_types = _CONTAINER_TYPES
+
+    root = [None]
+    # (value, container to write the converted value to, key/index within that container)
+    stack = [(obj, root, 0)]
+    # Tuples and sets are filled as lists, then finalised once all their elements are converted
+    to_finalise = []
+    while stack:
+        value, target, key = stack.pop()
+        value_type = type(value)
+        if value_type not in container_types:
+            if value_type not in scalar_converters:
+                _dispatch(value_type)
+                stack.append((value, target, key))
+                continue
+            target[key] = scalar_converters[value_type](value)
+            continue
+        container_type = container_types[value_type]
+        # Scalars are converted straight away, only containers go on the stack
+        if container_type is dict:
+            converted = {}
+            for item_key, item_value in value.items():
+                if (converter := scalar_converters.get(type(item_key))) is not None:
+                    item_key = converter(item_key)
+                else:
+                    item_key = floats_to_decimal(item_key)
+                if (converter := scalar_converters.get(type(item_value))) is not None:
+                    converted[item_key] = converter(item_value)
+                else:
+                    converted[item_key] = None  # Keeps the order of the keys
+                    stack.append((item_value, converted, item_key))
+        else:
+            converted = []
+            for idx, element in enumerate(value):
+                if (converter := scalar_converters.get(type(element))) is not None:
+                    converted.append(converter(element))
+                else:
+                    converted.append(None)
+                    stack.append((element, converted, idx))
+            if container_type is not list:
+                to_finalise.append((container_type, target, key, converted))
+        target[key] = converted
+    # Elements are finalised before the containers that hold them
+    for container_type, target, key, converted in reversed(to_finalise):
+        target[key] = container_type(converted)
+    return root[0]
+
+
+class ProfileRefresh:
+    """Thermostat control and graph fetched once for a heating profile refresh.
+
+    The dynamo dates and the heating profile are both derived from this snapshot, so the backend
+    is only asked for them once per refresh.
+    """
+
+    def __init__(
+        self, control: ThermostatControlResponse, graph: List[ThermostatPrediction]
+    ) -> None:
+        """Init."""
+        self.control = control
+        self.graph = graph
+        for prediction in self.graph:
+            if prediction.date.tzinfo is None:
+                prediction.date = prediction.date.replace(tzinfo=timezone.utc)
+
+    def data_dates(self):
+        """Oldest and newest dates in dynamo for each column."""
+        oldest_date = self.graph[0].date
+        newest_date = self.graph[-1].date
+        columns = [
+            const.DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER,
+            const.DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE,
+            const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY,
+        ]
+        oldest_dates = {column: oldest_date for column in columns}
+        newest_dates = {column: newest_date for column in columns}
+        return oldest_dates, newest_dates
+
+    def profile(self):
+        """Heat pump profile."""
+        results = {
+            "timestamp": [self.graph[0].date],
+            "electricity_price": [10],
+            "base_power": [15],
+            "optimised_power": [10],
+            "optimised_internal_temp": [self.graph[0].set_point],
+            "external_temp": [self.graph[0].set_point],
+            "temp_controls": [2],
+            "dni": [10],
+            "total_cost_optimised": 1.3,
+            "base_cost": 1.0,
+            "optimised_cost": 2.0,
         }
-    elif isinstance(obj, set):
-        return {floats_to_decimal(element) for element in obj}
-    elif isinstance(obj, list):
-        return [floats_to_decimal(element) for element in obj]
-    elif isinstance(obj, tuple):
-        return (floats_to_decimal(element) for element in obj)
-    elif isinstance(obj, datetime):
-        return floats_to_decimal(obj.timestamp())
-    else:
-        LOGGER.error(f"Object of type {type(obj)} not supported by DynamoDB")
-        raise TypeError(f"Object of type {type(obj)} not supported by DynamoDB")
+
+        if results["optimised_cost"] == 0:
+            # Heating isn't active.  Should the savings be 0?
+            results["projected_percent_savings"] = 100
+        else:
+            results["projected_percent_savings"] = (
+                results["base_cost"] / results["optimised_cost"] * 100 - 100
+            )
+        return results
 
 
 class OptisparkApiClient:
@@ -83,9 +224,7 @@ class OptisparkApiClient:
     _auth_service: AuthService
     _location_service: LocationService
     _config_service: ConfigurationService
-    _thermostat_id: int
-    # This is temporal
-    _graph_data: dict
+    _thermostat_id: int | None
 
     def __init__(
         self, session: aiohttp.ClientSession, user_hash: str, address: Address
@@ -96,10 +235,12 @@ class OptisparkApiClient:
         self._address = address
         self._has_locations = False
         self._has_devices = False
+        self._thermostat_id = None
         self._auth_service = AuthService(session=session, user_hash=user_hash)
         self._location_service = LocationService(session=session)
         self._device_service = DeviceService(session=session)
         self._thermostat_service = ThermostatService(session=session)
+        self._history_service = HistoryService(session=session)
         self._config_service: ConfigurationService = config_service
 
     def datetime_set_utc(self, d: dict[str, datetime]):
@@ -130,105 +271,111 @@ class OptisparkApiClient:
             )
         return control
 
-    async def get_data_dates(self):
-        """Call lambda and only get the newest and oldest dates in dynamo.
-        dynamo_data will only contain the user_hash.
-        """
+    async def begin_profile_refresh(
+        self, control: ThermostatControlResponse | None = None
+    ) -> ProfileRefresh:
+        """Fetch the thermostat control and graph for a heating profile refresh.
 
-        # 3f009bbd4f13f05061d40e980c86e817c60835017a152d3bf3efa089196665d9
-        LOGGER.debug(self._user_hash)
+        control can be given if it has already been fetched, to save a round trip.
+        """
         token = await self._auth_service.token
-        control = await self.get_thermostat_control()
-        self._graph_data: List[
-            ThermostatPrediction
-        ] = await self._thermostat_service.get_graph(
+        if control is None:
+            control = await self.get_thermostat_control()
+        graph: List[ThermostatPrediction] = await self._thermostat_service.get_graph(
             access_token=token, thermostat_id=control.thermostat_id
         )
+        return ProfileRefresh(control, graph)
 
-        oldest_date = self._graph_data[0].date
-        newest_date = self._graph_data[-1].date
-
-        extra = {
-            "oldest_dates": {
-                "heat_pump_power": oldest_date,
-                "external_temperature": oldest_date,
-                "climate_entity": oldest_date,
-            },
-            "newest_dates": {
-                "heat_pump_power": newest_date,
-                "external_temperature": newest_date,
-                "climate_entity": newest_date,
-            },
-        }
+    async def get_data_dates(self, refresh: ProfileRefresh | None = None):
+        """Get the newest and oldest dates in dynamo.
 
-        oldest_dates = self.datetime_set_utc(extra["oldest_dates"])
-        newest_dates = self.datetime_set_utc(extra["newest_dates"])
+        Derived from refresh, which is fetched if not given.
+        """
+        LOGGER.debug(self._user_hash)
+        if refresh is None:
+            refresh = await self.begin_profile_refresh()
+        return refresh.data_dates()
 
-        return oldest_dates, newest_dates
+    async def async_get_profile(self, lambda_args: dict, refresh: ProfileRefresh | None = None):
+        """Get heat pump profile only.
 
-    async def async_get_profile(self, lambda_args: dict):
-        """Get heat pump profile only."""
+        Derived from refresh, which is fetched if not given.
+        """
         LOGGER.debug("Fetching profile")
         payload = lambda_args
         payload["get_profile_only"] = True
-        if not self._graph_data:
-            token = await self._auth_service.token
-            control = await self.get_thermostat_control()
-            self._graph_data: List[
-                ThermostatPrediction
-            ] = await self._thermostat_service.get_graph(
-                access_token=token, thermostat_id=control.thermostat_id
-            )
+        if refresh is None:
+            refresh = await self.begin_profile_refresh()
+        return refresh.profile()
 
-        if self._graph_data[0].date.tzinfo is None:
-            self._graph_data[0].date = self._graph_data[0].date.replace(
-                tzinfo=timezone.utc
-            )
+    @property
+    def history_upload_enabled(self) -> bool:
+        """Whether history can be uploaded, the backend endpoint is set in the config."""
+        return self._history_service.enabled
 
-        results = {
-            "timestamp": [self._graph_data[0].date],
-            "electricity_price": [10],
-            "base_power": [15],
-            "optimised_power": [10],
-            "optimised_internal_temp": [self._graph_data[0].set_point],
-            "external_temp": [self._graph_data[0].set_point],
-            "temp_controls": [2],
-            "dni": [10],
-            "total_cost_optimised": 1.3,
-            "base_cost": 1.0,
-            "optimised_cost": 2.0,
+    async def upload_history(self, body: bytes, content_encoding: str | None):
+        """Upload a history chunk encoded by history.encode_payload_body.
+
+        Returns how long the upload request took in seconds.
+        """
+        token = await self._auth_service.token
+        return await self._history_service.upload(body, content_encoding, token)
+
+    def resolved_ids(self) -> dict:
+        """What has been resolved with the backend, saved for a warm start."""
+        return {
+            "has_locations": self._has_locations,
+            "has_devices": self._has_devices,
+            "thermostat_id": self._thermostat_id,
         }
 
-        if results["optimised_cost"] == 0:
-            # Heating isn't active.  Should the savings be 0?
-            results["projected_percent_savings"] = 100
-        else:
-            results["projected_percent_savings"] = (
-                results["base_cost"] / results["optimised_cost"] * 100 - 100
+    def restore_resolved_ids(self, resolved_ids: dict):
+        """Restore what resolved_ids returned before a restart.
+
+        check_location_and_device doesn't need to log in again if the location and device are
+        known to exist.
+        """
+        self._has_locations = resolved_ids["has_locations"]
+        self._has_devices = resolved_ids["has_devices"]
+        self._thermostat_id = resolved_ids["thermostat_id"]
+
+    async def _get_thermostat_id(self, token: str) -> int | None:
+        """Id of the thermostat of the first location, None if there are no locations.
+
+        The id is looked up once and kept, it is also restored by restore_resolved_ids.
+        """
+        if self._thermostat_id is None:
+            locations = await self._location_service.get_locations(token)
+            if len(locations) > 0:
+                self._thermostat_id = locations[0].thermostat_id
+        return self._thermostat_id
+
+    async def _get_control(self, token: str) -> ThermostatControlResponse | None:
+        """Thermostat control, the thermostat id is looked up again if fetching it fails."""
+        thermostat_id = await self._get_thermostat_id(token)
+        if thermostat_id is None:
+            return None
+        try:
+            return await self._thermostat_service.get_control(
+                thermostat_id=thermostat_id, access_token=token
             )
-        return results
+        except OptisparkApiClientThermostatError:
+            self._thermostat_id = None
+            raise
 
     async def get_thermostat_control(self) -> ThermostatControlResponse:
         LOGGER.debug('Fetching thermostat control')
         token = await self._auth_service.token
-        locations = await self._location_service.get_locations(token)
-        if len(locations) > 0:
-            thermostat_id = locations[0].thermostat_id
-            control = await self._thermostat_service.get_control(
-                thermostat_id=thermostat_id, access_token=token
-            )
+        control = await self._get_control(token)
+        if control is not None:
             LOGGER.debug(f'id:{control.thermostat_id} {control.mode} {control.status}')
             return control
 
     async def get_thermostat_info(self) -> ThermostatInfo:
         token = await self._auth_service.token
-        locations = await self._location_service.get_locations(token)
-        if len(locations) > 0:
-            thermostat_id = locations[0].thermostat_id
-            LOGGER.debug(f"Getting thermostat control mode")
-            control = await self._thermostat_service.get_control(
-                thermostat_id=thermostat_id, access_token=token
-            )
+        LOGGER.debug(f"Getting thermostat control mode")
+        control = await self._get_control(token)
+        if control is not None:
             return to_thermostat_info(control)
 
     async def set_manual(self, data: ControlInfo) -> ThermostatControlResponse | None:
@@ -249,10 +396,10 @@ class OptisparkApiClient:
         LOGGER.debug('Post thermostat control request')
         LOGGER.debug(request)
         token = await self._auth_service.token
-        locations = await self._location_service.get_locations(token)
-        if locations[0]:
+        thermostat_id = await self._get_thermostat_id(token)
+        if thermostat_id is not None:
             response = await self._thermostat_service.create_manual(
-                thermostat_id=locations[0].thermostat_id,
+                thermostat_id=thermostat_id,
                 request=request,
                 access_token=token
             )
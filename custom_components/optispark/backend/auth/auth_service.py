@@ -20,19 +20,18 @@ class AuthService:
         """Sample API Client."""
         self._login_response = None
         self._session = session
-        self._base_url = config_service.get('backend.baseUrl')
-        self._ssl = config_service.get('backend.verifySSL', default=True)
         self._token = None
         self._user_hash = user_hash
 
     async def login(self) -> LoginResponse:
-        auth_url = f'{self._base_url}/auth/ha_login'
+        config = config_service.snapshot
+        auth_url = config.url('backend.auth.login')
         try:
             payload = {"user_hash": self._user_hash}
             response = await self._session.post(
                 url=auth_url,
                 json=payload,
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status != HTTPStatus.OK:
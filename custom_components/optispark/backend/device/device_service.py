@@ -21,11 +21,10 @@ class DeviceService:
     ) -> None:
         """Sample API Client."""
         self._session = session
-        self._base_url = config_service.get("backend.baseUrl")
-        self._ssl = config_service.get('backend.verifySSL', default=True)
 
     async def get_devices(self, location_id: int, access_token: str) -> List[DeviceResponse]:
-        device_url = f'{self._base_url}/{config_service.get("backend.device.base")}/'
+        config = config_service.snapshot
+        device_url = f'{config.url("backend.device.base")}/'
         headers = {
             "Authorization": f"Bearer {access_token}"
         }
@@ -35,7 +34,7 @@ class DeviceService:
                 url=device_url,
                 headers=headers,
                 params={'location_id': location_id},
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status == HTTPStatus.UNAUTHORIZED:
@@ -62,7 +61,8 @@ class DeviceService:
 
     async def add_device(self, request: DeviceRequest, access_token: str) -> DeviceResponse | None:
 
-        device_url = f'{self._base_url}/{config_service.get("backend.device.base")}/'
+        config = config_service.snapshot
+        device_url = f'{config.url("backend.device.base")}/'
         headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
@@ -72,7 +72,7 @@ class DeviceService:
                 url=device_url,
                 headers=headers,
                 json=request.payload(),
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status == HTTPStatus.UNAUTHORIZED:
@@ -97,8 +97,8 @@ class DeviceService:
 
     async def add_device_data(self, device_id: int, request: DeviceDataRequest, access_token: str) -> bool:
 
-        endpoint = config_service.get("backend.device.data")
-        device_url = f'{self._base_url}/{endpoint}'.replace("{device_id}", str(device_id))
+        config = config_service.snapshot
+        device_url = config.url("backend.device.data", device_id=device_id)
         headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
@@ -108,7 +108,7 @@ class DeviceService:
                 url=device_url,
                 headers=headers,
                 json=request.payload(),
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status == HTTPStatus.UNAUTHORIZED:
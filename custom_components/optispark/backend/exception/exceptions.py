@@ -6,7 +6,8 @@ __all__ = [
     "OptisparkApiClientLambdaError",
     "OptisparkApiClientPostcodeError",
     "OptisparkApiClientUnitError",
-    "OptisparkApiClientLocationError"
+    "OptisparkApiClientLocationError",
+    "OptisparkApiClientPayloadTooLargeError",
 ]
 
 
@@ -18,6 +19,10 @@ class OptisparkApiClientTimeoutError(OptisparkApiClientError):
     """Lamba probably took too long starting up."""
 
 
+class OptisparkApiClientPayloadTooLargeError(OptisparkApiClientError):
+    """Exception to indicate the backend rejected a request for being too large (413)."""
+
+
 class OptisparkApiClientCommunicationError(OptisparkApiClientError):
     """Exception to indicate a communication error."""
 
@@ -48,3 +53,7 @@ class OptisparkApiClientDeviceError(OptisparkApiClientError):
 
 class OptisparkApiClientThermostatError(OptisparkApiClientError):
     """Exception to indicate an thermostat error."""
+
+
+class OptisparkApiClientHistoryError(OptisparkApiClientError):
+    """Exception to indicate a history upload error."""
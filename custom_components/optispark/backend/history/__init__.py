@@ -0,0 +1 @@
+"""History upload to the OptiSpark backend."""
@@ -0,0 +1,80 @@
+"""Upload encoded history chunks to the OptiSpark backend."""
+from http import HTTPStatus
+import asyncio
+import time
+
+import aiohttp
+
+from custom_components.optispark import const
+from custom_components.optispark.const import LOGGER
+from custom_components.optispark.configuration_service import config_service
+from custom_components.optispark.backend.exception.exceptions import OptisparkApiClientAuthenticationError, \
+    OptisparkApiClientHistoryError, OptisparkApiClientPayloadTooLargeError, OptisparkApiClientTimeoutError
+
+
+class HistoryService:
+    """History upload endpoint."""
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+    ) -> None:
+        """History upload client."""
+        self._session = session
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the backend has a history upload endpoint configured."""
+        return config_service.get("backend.history.upload") is not None
+
+    async def upload(self, body: bytes, content_encoding: str | None, access_token: str) -> float:
+        """Upload an encoded history payload, body is JSON compressed with content_encoding.
+
+        Returns how long the request took in seconds.  Raises OptisparkApiClientTimeoutError if
+        it takes longer than const.UPLOAD_CHUNK_TIMEOUT and OptisparkApiClientPayloadTooLargeError
+        if the backend rejects it as too large, both mean a smaller chunk should be sent.
+        """
+        config = config_service.snapshot
+        history_url = config.url("backend.history.upload")
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        }
+        if content_encoding is not None:
+            headers["Content-Encoding"] = content_encoding
+        try:
+            start = time.monotonic()
+            async with self._session.post(
+                url=history_url,
+                headers=headers,
+                data=body,
+                ssl=config.verify_ssl,
+                timeout=aiohttp.ClientTimeout(total=const.UPLOAD_CHUNK_TIMEOUT),
+            ) as response:
+                seconds = time.monotonic() - start
+
+                if response.status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE:
+                    raise OptisparkApiClientPayloadTooLargeError(
+                        f"History chunk of {len(body)} bytes is too large",
+                    ) from Exception
+
+                if response.status == HTTPStatus.UNAUTHORIZED:
+                    raise OptisparkApiClientAuthenticationError(
+                        "Invalid credentials",
+                    ) from Exception
+
+                if response.status not in (HTTPStatus.OK, HTTPStatus.CREATED):
+                    raise OptisparkApiClientHistoryError(
+                        f"Upload history error ({response.status})",
+                    ) from Exception
+
+                return seconds
+
+        except asyncio.TimeoutError as e:
+            raise OptisparkApiClientTimeoutError("Upload history timed out") from e
+        except aiohttp.ClientError as e:
+            LOGGER.error(f"HTTP error occurred: {e}")
+            raise OptisparkApiClientHistoryError("Upload history error") from e
+        except Exception as e:
+            LOGGER.error(f"Unexpected error occurred: {e}")
+            raise
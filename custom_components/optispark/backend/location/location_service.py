@@ -21,13 +21,12 @@ class LocationService:
     ) -> None:
         """Sample API Client."""
         self._session = session
-        self._base_url = config_service.get("backend.baseUrl")
-        self._ssl = config_service.get('backend.verifySSL', default=True)
 
     async def add_location(self, request: LocationRequest, access_token: str) -> LocationResponse | None:
         """Add new location"""
 
-        location_url = f'{self._base_url}/{config_service.get("backend.location.base")}/'
+        config = config_service.snapshot
+        location_url = f'{config.url("backend.location.base")}/'
         headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
@@ -38,7 +37,7 @@ class LocationService:
                 url=location_url,
                 headers=headers,
                 json=request.payload(),
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status == HTTPStatus.UNAUTHORIZED:
@@ -63,7 +62,8 @@ class LocationService:
 
     async def get_locations(self, access_token: str) -> [LocationResponse]:
         """Get locations from OptiSpark backend"""
-        location_url = f'{self._base_url}/{config_service.get("backend.location.base")}/'
+        config = config_service.snapshot
+        location_url = f'{config.url("backend.location.base")}/'
         headers = {
             "Authorization": f"Bearer {access_token}"
         }
@@ -72,7 +72,7 @@ class LocationService:
             response = await self._session.get(
                 url=location_url,
                 headers=headers,
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status == HTTPStatus.UNAUTHORIZED:
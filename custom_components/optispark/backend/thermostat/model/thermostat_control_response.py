@@ -33,8 +33,8 @@ class ThermostatControlResponse:
         try:
             if json['heatSetPoint']:
                 heat_set_point = json['heatSetPoint']
-            if json['heatSetPoint']:
-                heat_set_point = json['heatSetPoint']
+            if json.get('coolSetPoint'):
+                cool_set_point = json['coolSetPoint']
             return cls(
                 thermostat_id=json['thermostatId'],
                 status=ThermostatControlStatus(json['status']),
@@ -49,3 +49,13 @@ class ThermostatControlResponse:
         except Exception as e:
             LOGGER.error(f"Error: {e}")
             return None
+
+    def to_json(self) -> dict:
+        """Inverse of from_json, used to save the control in the warm start snapshot."""
+        return {
+            'thermostatId': self.thermostat_id,
+            'status': self.status.value,
+            'mode': self.mode.value,
+            'heatSetPoint': self.heat_set_point,
+            'coolSetPoint': self.cool_set_point,
+        }
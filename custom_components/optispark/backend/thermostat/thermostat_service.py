@@ -22,8 +22,6 @@ class ThermostatService:
         """Sample API Client."""
         self._session = session
         self._config_service: ConfigurationService = config_service
-        self._base_url = config_service.get("backend.baseUrl")
-        self._ssl = config_service.get("backend.verifySSL")
         self._cache = {}
 
     async def get_control(self, thermostat_id: int, access_token: str) -> ThermostatControlResponse:
@@ -37,8 +35,8 @@ class ThermostatService:
                 LOGGER.debug("Returning control from cache")
                 return cached_response
 
-        endpoint = config_service.get("backend.thermostat.control")
-        thermostat_url = f'{self._base_url}/{endpoint}'.replace("{thermostat_id}", str(thermostat_id))
+        config = config_service.snapshot
+        thermostat_url = config.url("backend.thermostat.control", thermostat_id=thermostat_id)
         headers = {
             "Authorization": f"Bearer {access_token}",
         }
@@ -46,7 +44,7 @@ class ThermostatService:
             response = await self._session.get(
                 url=thermostat_url,
                 headers=headers,
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status == HTTPStatus.UNAUTHORIZED:
@@ -83,8 +81,8 @@ class ThermostatService:
         cache_key = f"{thermostat_id}"
         current_time = datetime.now()
         # ssl = config_service.get('backend.verifySSL', default=True)
-        endpoint = config_service.get("backend.thermostat.manual")
-        thermostat_url = f'{self._base_url}/{endpoint}'.replace("{thermostat_id}", str(thermostat_id))
+        config = config_service.snapshot
+        thermostat_url = config.url("backend.thermostat.manual", thermostat_id=thermostat_id)
         headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
@@ -94,7 +92,7 @@ class ThermostatService:
                 url=thermostat_url,
                 headers=headers,
                 json=request.to_dict(),
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status == HTTPStatus.UNAUTHORIZED:
@@ -122,9 +120,9 @@ class ThermostatService:
 
     async def get_graph(self, thermostat_id: int, access_token: str) -> List[ThermostatPrediction]:
         # Graph query param,
-        hours_from_now = config_service.get("hoursFromNow")
-        endpoint = config_service.get("backend.thermostat.graph")
-        graph_url = f'{self._base_url}/{endpoint}'.replace("{thermostat_id}", str(thermostat_id))
+        config = config_service.snapshot
+        hours_from_now = config.get("hoursFromNow")
+        graph_url = config.url("backend.thermostat.graph", thermostat_id=thermostat_id)
         headers = {
             "Authorization": f"Bearer {access_token}",
         }
@@ -133,7 +131,7 @@ class ThermostatService:
                 url=graph_url,
                 headers=headers,
                 params={'hours_from_now': hours_from_now},
-                ssl=self._ssl
+                ssl=config.verify_ssl
             )
 
             if response.status == HTTPStatus.UNAUTHORIZED:
@@ -1,13 +1,46 @@
 from datetime import datetime, timezone, timedelta
+from typing import NamedTuple
+import asyncio
 
-from custom_components.optispark import OptisparkApiClient, const, LOGGER, history
-import numpy as np
+from homeassistant.core import callback
+from homeassistant.helpers.event import (
+    async_track_point_in_utc_time,
+    async_track_time_interval,
+)
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
 
+from custom_components.optispark import (
+    OptisparkApiClient,
+    const,
+    LOGGER,
+    history,
+    fallback,
+    statistics_exporter,
+)
+from custom_components.optispark.api import ProfileRefresh
+
+from custom_components.optispark.chunk_sizer import UploadChunkSizer
 from custom_components.optispark.domain.control.control_info import ControlInfo
+from custom_components.optispark.profile import ProfileIndex
+from custom_components.optispark.backend.exception.exceptions import (
+    OptisparkApiClientError,
+    OptisparkApiClientPayloadTooLargeError,
+    OptisparkApiClientTimeoutError,
+)
 from custom_components.optispark.backend.thermostat.model.thermostat_control_response import ThermostatControlResponse
 from custom_components.optispark.backend.thermostat.model.thermostat_control_status import ThermostatControlStatus
 
 
+class HistoryChunk(NamedTuple):
+    """A chunk of history that is ready to be uploaded."""
+
+    body: bytes
+    content_encoding: str | None
+    readings: int
+    newest_dates: dict[str, datetime]
+
+
 class BackendUpdateHandler:
     """Backend communication handler
     """
@@ -25,8 +58,13 @@ class BackendUpdateHandler:
         city,
         country,
         tariff,
+        request_refresh=None,
     ):
-        """Init."""
+        """Init.
+
+        request_refresh is awaited when a heating profile fetched in the background is swapped in,
+        so that the entities are updated straight away rather than on the next scheduled update.
+        """
         self.hass = hass
         self.client: OptisparkApiClient = client
         self.climate_entity_id = climate_entity_id
@@ -41,10 +79,41 @@ class BackendUpdateHandler:
         self.expire_time = datetime(
             1, 1, 1, 0, 0, 0, tzinfo=timezone.utc
         )  # Already expired
-        # Interval to upload device data (in seconds)
-        self.update_device_data_countdown = const.UPDATE_DEVICE_DATA_INTERVAL
+        self.profile: ProfileIndex | None = None
+        # Fetched in the background, swapped in once it has started
+        self.next_profile: ProfileIndex | None = None
+        self.profile_expired = True
+        self._request_refresh = request_refresh
+        self._cancel_profile_expiry = None
+        self._cancel_profile_prefetch = None
+        self._prefetch_task = None
+        self._cancel_device_data_interval = None
+        # Most recent lambda_args, sent to the backend as device data and used for prefetching
+        self.last_lambda_args = None
+        # Most recent thermostat control from the backend, saved in the warm start snapshot
+        self.last_control: ThermostatControlResponse | None = None
         self.manual_update = False
         self.history_upload_complete = False
+        # Newest/oldest dates of the data in dynamo for each column, None if unknown
+        self.dynamo_oldest_dates = None
+        self.dynamo_newest_dates = None
+        # When the dynamo dates were last fetched from the backend
+        self.dynamo_dates_reconciled = None
+        self._checkpoint_store = Store(
+            hass,
+            const.HISTORY_CHECKPOINT_STORAGE_VERSION,
+            const.HISTORY_CHECKPOINT_STORAGE_KEY,
+        )
+        self._checkpoint_loaded = False
+        self._warm_start_store = Store(
+            hass,
+            const.WARM_START_STORAGE_VERSION,
+            const.WARM_START_STORAGE_KEY,
+        )
+        # (profile, control, resolved ids) of the last scheduled save
+        self._warm_start_saved = None
+        self.chunk_sizer = UploadChunkSizer()
+        self._statistics_exporter = statistics_exporter.StatisticsExporter(hass)
         self.outside_range_flag = False
         self.id_to_column_name_lookup = {
             climate_entity_id: const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY,
@@ -62,6 +131,298 @@ class BackendUpdateHandler:
             if entity_id is not None:
                 self.active_entity_ids.append(entity_id)
 
+    async def async_load_checkpoint(self):
+        """Restore the history upload checkpoint saved before the last restart.
+
+        Only loaded once.  The checkpoint is ignored if it was saved for a different user_hash.
+        """
+        if self._checkpoint_loaded:
+            return
+        self._checkpoint_loaded = True
+        checkpoint = await self._checkpoint_store.async_load()
+        if checkpoint is None or checkpoint.get("user_hash") != self.user_hash:
+            return
+
+        def parse_dates(dates):
+            return {
+                column: dt_util.parse_datetime(date) if date is not None else None
+                for column, date in dates.items()
+            }
+
+        self.history_upload_complete = checkpoint["history_upload_complete"]
+        self.dynamo_oldest_dates = parse_dates(checkpoint["dynamo_oldest_dates"])
+        self.dynamo_newest_dates = parse_dates(checkpoint["dynamo_newest_dates"])
+        self.dynamo_dates_reconciled = dt_util.parse_datetime(
+            checkpoint["dynamo_dates_reconciled"]
+        )
+        LOGGER.debug(f"History upload checkpoint restored: {self.dynamo_newest_dates}")
+
+    def _checkpoint_data(self):
+        """Data saved by the history upload checkpoint."""
+
+        def format_dates(dates):
+            return {
+                column: date.isoformat() if date is not None else None
+                for column, date in dates.items()
+            }
+
+        return {
+            "user_hash": self.user_hash,
+            "history_upload_complete": self.history_upload_complete,
+            "dynamo_oldest_dates": format_dates(self.dynamo_oldest_dates),
+            "dynamo_newest_dates": format_dates(self.dynamo_newest_dates),
+            "dynamo_dates_reconciled": self.dynamo_dates_reconciled.isoformat(),
+        }
+
+    def save_checkpoint(self):
+        """Schedule a save of the history upload checkpoint."""
+        if self.dynamo_newest_dates is None or self.dynamo_dates_reconciled is None:
+            return
+        self._checkpoint_store.async_delay_save(
+            self._checkpoint_data, const.HISTORY_CHECKPOINT_SAVE_DELAY
+        )
+
+    async def reconcile_dynamo_dates(
+        self, lambda_args: dict, control: ThermostatControlResponse | None = None
+    ) -> ProfileRefresh | None:
+        """Fetch the dynamo dates from the backend if the checkpoint can't be trusted.
+
+        That is when there is no checkpoint or it hasn't been checked against the backend for
+        const.HISTORY_CHECKPOINT_RECONCILE_INTERVAL seconds.
+        Returns the ProfileRefresh the dates were taken from, None if the checkpoint was used.
+        """
+        await self.async_load_checkpoint()
+        now = datetime.now(tz=timezone.utc)
+        if (
+            self.dynamo_newest_dates is not None
+            and self.dynamo_dates_reconciled is not None
+            and now - self.dynamo_dates_reconciled
+            < timedelta(seconds=const.HISTORY_CHECKPOINT_RECONCILE_INTERVAL)
+        ):
+            return None
+        refresh = await self.client.begin_profile_refresh(control)
+        await self.update_dynamo_dates(lambda_args, refresh)
+        self.dynamo_dates_reconciled = now
+        self.save_checkpoint()
+        return refresh
+
+    async def async_load_warm_start(self) -> ThermostatControlResponse | None:
+        """Restore the heating profile and backend state saved after the last refresh.
+
+        The snapshot is ignored if it was saved for a different user_hash.  A profile that hasn't
+        expired is used until a fresh one has been fetched, it is marked as expired so the first
+        update prefetches its replacement in the background.
+        Returns the saved thermostat control, None if there is no usable snapshot.
+        """
+        snapshot = await self._warm_start_store.async_load()
+        if snapshot is None or snapshot.get("user_hash") != self.user_hash:
+            return None
+        try:
+            profile = ProfileIndex.from_json(snapshot["profile"])
+            control = ThermostatControlResponse.from_json(snapshot["control"])
+        except (KeyError, TypeError, ValueError, IndexError) as err:
+            LOGGER.warning(f"Ignoring the warm start snapshot, it couldn't be read: {err}")
+            return None
+        if control is None:
+            # from_json logs the error and returns None rather than raising
+            LOGGER.warning("Ignoring the warm start snapshot, its thermostat control is invalid")
+            return None
+        try:
+            self.client.restore_resolved_ids(snapshot["client"])
+        except (KeyError, TypeError) as err:
+            LOGGER.warning(f"Ignoring the warm start snapshot, it couldn't be read: {err}")
+            return None
+        if profile.expire_time > datetime.now(tz=timezone.utc):
+            self.profile = profile
+            self.profile_expired = True
+            LOGGER.debug(f"Heating profile restored, expires at {profile.expire_time}")
+        self.last_control = control
+        self._warm_start_saved = (self.profile, snapshot["control"], snapshot["client"])
+        return control
+
+    def _warm_start_data(self):
+        """Data saved by the warm start snapshot."""
+        return {
+            "user_hash": self.user_hash,
+            "profile": self.profile.to_json(),
+            "control": self.last_control.to_json(),
+            "client": self.client.resolved_ids(),
+        }
+
+    def save_warm_start(self):
+        """Schedule a save of the warm start snapshot if the profile, control or ids have changed.
+
+        Called on every update, a save that was scheduled each time would be pushed back by every
+        call and never written.
+        """
+        if self.profile is None or self.last_control is None:
+            return
+        saved = (self.profile, self.last_control.to_json(), self.client.resolved_ids())
+        if self._warm_start_saved is not None and (
+            saved[0] is self._warm_start_saved[0] and saved[1:] == self._warm_start_saved[1:]
+        ):
+            return
+        self._warm_start_saved = saved
+        self._warm_start_store.async_delay_save(
+            self._warm_start_data, const.WARM_START_SAVE_DELAY
+        )
+
+    def diagnostics(self) -> dict:
+        """State of the history upload for diagnostics."""
+
+        def format_dates(dates):
+            if dates is None:
+                return None
+            return {
+                column: date.isoformat() if date is not None else None
+                for column, date in dates.items()
+            }
+
+        return {
+            "history_upload_complete": self.history_upload_complete,
+            "dynamo_oldest_dates": format_dates(self.dynamo_oldest_dates),
+            "dynamo_newest_dates": format_dates(self.dynamo_newest_dates),
+            "upload_chunk_sizer": self.chunk_sizer.as_dict(),
+            "profile_expire_time": self.expire_time.isoformat(),
+            "profile_prefetching": self._prefetch_task is not None
+            and not self._prefetch_task.done(),
+        }
+
+    def set_expire_time(self, expire_time):
+        """Record when the heating profile expires and schedule its refresh.
+
+        The next profile is prefetched const.PROFILE_PREFETCH_LEAD seconds before expire_time.
+        Neither is scheduled sooner than const.UPDATE_INTERVAL seconds from now, so a profile that
+        has already expired is not fetched in a tight loop.
+        """
+        self.expire_time = expire_time
+        self.profile_expired = False
+        self._cancel_profile_timers()
+        earliest = datetime.now(tz=timezone.utc) + timedelta(seconds=const.UPDATE_INTERVAL)
+        self._cancel_profile_expiry = async_track_point_in_utc_time(
+            self.hass, self._async_profile_expired, max(expire_time, earliest)
+        )
+        self._cancel_profile_prefetch = async_track_point_in_utc_time(
+            self.hass,
+            self._async_prefetch_due,
+            max(expire_time - timedelta(seconds=const.PROFILE_PREFETCH_LEAD), earliest),
+        )
+
+    def _cancel_profile_timers(self):
+        if self._cancel_profile_expiry is not None:
+            self._cancel_profile_expiry()
+            self._cancel_profile_expiry = None
+        if self._cancel_profile_prefetch is not None:
+            self._cancel_profile_prefetch()
+            self._cancel_profile_prefetch = None
+
+    @callback
+    def _async_prefetch_due(self, _now):
+        self._cancel_profile_prefetch = None
+        self.start_profile_prefetch()
+
+    @callback
+    def _async_profile_expired(self, _now):
+        """Flag the heating profile as expired.
+
+        The current profile keeps being used until the prefetch has finished.
+        """
+        self._cancel_profile_expiry = None
+        self.profile_expired = True
+        LOGGER.debug(f"Heating profile expired at {self.expire_time}")
+        self.start_profile_prefetch()
+
+    def start_profile_prefetch(self):
+        """Fetch the next heating profile in the background, unless it is already being fetched."""
+        if self.last_lambda_args is None or (
+            self._prefetch_task is not None and not self._prefetch_task.done()
+        ):
+            return
+        self._prefetch_task = self.hass.async_create_background_task(
+            self._async_prefetch_profile(dict(self.last_lambda_args)),
+            "optispark heating profile prefetch",
+        )
+
+    def cancel_profile_prefetch(self):
+        """Cancel the background fetch of the next heating profile."""
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+
+    async def _async_prefetch_profile(self, lambda_args):
+        """Fetch the next heating profile and swap it in.
+
+        If it fails, the current profile is kept and the fetch is retried on the next update once
+        the profile has expired.
+        """
+        LOGGER.debug("Prefetching heating profile")
+        try:
+            profile = await self.fetch_heating_profile(lambda_args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.warning(f"Unable to prefetch heating profile: {err}")
+            return
+        self.swap_profile(profile)
+        if self._request_refresh is not None:
+            await self._request_refresh()
+
+    def swap_profile(self, profile: ProfileIndex):
+        """Start using profile.
+
+        A profile whose first time step is still in the future is held in self.next_profile until
+        it starts.  The profile is exported to the long-term statistics straight away.
+        """
+        self.hass.async_create_background_task(
+            self._statistics_exporter.async_export_profile(profile),
+            "optispark statistics export",
+        )
+        if self.profile is None or profile.starts_before(datetime.now(tz=timezone.utc)):
+            self.profile = profile
+            self.next_profile = None
+        else:
+            self.next_profile = profile
+        self.set_expire_time(profile.expire_time)
+
+    def start_device_data_updates(self):
+        """Send the device data every const.UPDATE_DEVICE_DATA_INTERVAL seconds."""
+        if self._cancel_device_data_interval is not None:
+            return
+        self._cancel_device_data_interval = async_track_time_interval(
+            self.hass,
+            self._async_send_device_data,
+            timedelta(seconds=const.UPDATE_DEVICE_DATA_INTERVAL),
+        )
+
+    async def _async_send_device_data(self, _now):
+        """Send the most recent lambda_args to the backend."""
+        if self.last_lambda_args is None:
+            return
+        LOGGER.debug('Sending device data to OptiSpark backend')
+        try:
+            await self._update_device_data(self.last_lambda_args)
+        except OptisparkApiClientError as err:
+            LOGGER.warning(f'Unable to send device data to OptiSpark backend: {err}')
+
+    @callback
+    def async_shutdown(self):
+        """Cancel the scheduled profile refresh, any prefetch and the device data updates.
+
+        The profile is treated as expired, it is fetched again on the next call.
+        """
+        self._cancel_profile_timers()
+        self.cancel_profile_prefetch()
+        if self._cancel_device_data_interval is not None:
+            self._cancel_device_data_interval()
+            self._cancel_device_data_interval = None
+        self.profile_expired = True
+
+    def entity_columns(self, entity_ids):
+        """Map each of entity_ids to its database column name."""
+        return {
+            entity_id: self.id_to_column_name_lookup[entity_id] for entity_id in entity_ids
+        }
+
     def get_missing_histories_boundary(self, history_states, dynamo_date):
         """Get index where history_state matches dynamo_date."""
         idx_bound = 0
@@ -71,93 +432,166 @@ class BackendUpdateHandler:
                 return idx_bound
         return idx_bound  # type: ignore
 
-    def get_missing_old_histories_states(self, history_states, column):
-        """Get states that are older than anything in dynamo."""
+    def get_missing_old_histories_states(self, history_states, column, chunk_size):
+        """Get the newest chunk_size states that are older than anything in dynamo.
+
+        Resampling intervals are not split, the chunk starts at the first reading of an interval
+        and ends at the interval dynamo starts in.  The state before the chunk is included, it is
+        held into the chunk's first interval.
+        Returns the states and the (start, end) of their intervals, or ([], None) if there are no
+        older states.  start is where dynamo starts once the chunk is uploaded.
+        """
         dynamo_date = self.dynamo_oldest_dates[column]
-        idx_bound = self.get_missing_histories_boundary(history_states, dynamo_date)
-        return history_states[:idx_bound]
+        if dynamo_date is None:
+            # Nothing in dynamo yet, upload_new_history uploads the recent history first
+            return [], None
+        resolution = const.HISTORY_RESAMPLE_SECONDS.get(column)
+        end = dynamo_date.timestamp()
+        if resolution is not None:
+            end = end // resolution * resolution
+        history_states = [
+            state for state in history_states if state.last_updated_timestamp < end
+        ]
+        if not history_states:
+            return [], None
+        start_idx = history.resample_chunk_start(
+            column, history_states, len(history_states) - chunk_size
+        )
+        start = history_states[start_idx].last_updated_timestamp
+        if resolution is None:
+            return history_states[start_idx:], (start, end)
+        start = start // resolution * resolution
+        return history_states[max(start_idx - 1, 0):], (start, end)
+
+    async def get_missing_old_statistics(self, entity_id, column, chunk_size):
+        """Get the newest chunk_size long-term statistics that are older than anything in dynamo.
+
+        Returns None if the column has no statistics or they have all been uploaded.
+        """
+        dynamo_date = self.dynamo_oldest_dates[column]
+        if dynamo_date is None or column not in const.HISTORY_STATISTICS_COLUMNS:
+            return None
+        column_history, constant_attributes = await history.get_statistics_column(
+            self.hass, entity_id, dynamo_date
+        )
+        if len(column_history) == 0:
+            return None
+        column_history = history.HistoryColumn(
+            column_history.entity_id,
+            column_history.timestamps[-chunk_size:],
+            column_history.states[-chunk_size:],
+        )
+        return column_history, constant_attributes
+
+    def get_missing_new_histories_states(self, history_states, column, now=None):
+        """Get states that are newer than anything in dynamo and can be uploaded.
 
-    def get_missing_new_histories_states(self, history_states, column):
-        """Get states that are newer than anything in dynamo."""
+        States after self.upload_horizon(column, now) are left for a later upload.  For resampled
+        columns the state held at the newest date in dynamo comes first, it fills the intervals
+        up to the first new state.
+        """
         dynamo_date = self.dynamo_newest_dates[column]
         if dynamo_date is None:
             # No data in dynamo - upload first x days
             dynamo_date = datetime.now(tz=timezone.utc) - timedelta(
                 days=const.HISTORY_DAYS
             )
-        idx_bound = self.get_missing_histories_boundary(history_states, dynamo_date)
-        if idx_bound == len(history_states) - 1:
-            error = True
-        else:
-            error = False
-        return history_states[idx_bound + 1 :], error
+        horizon = self.upload_horizon(column, now)
+        held = None
+        missing = []
+        for state in history_states:
+            if state.last_updated <= dynamo_date:
+                held = state
+            elif horizon is None or state.last_updated <= horizon:
+                missing.append(state)
+        window = self.upload_window(column, now)
+        if (
+            held is not None and window is not None and window[0] is not None
+            and window[0] < window[1]
+        ):
+            missing.insert(0, held)
+        return missing, not missing
 
-    async def upload_new_history(self, missing_entities):
-        """Upload section of new history states that are newer than anything in dynamo.
+    def upload_horizon(self, column, now=None):
+        """Newest date of column's history that can be uploaded, None if there is no history.
 
-        self.dynamo_dates is updated so that if this function is called again a new section will be
-        uploaded.
-        const.MAX_UPLOAD_HISTORY_READINGS number of readings are uploaded to avoid long delay.
+        Resampled columns are uploaded up to the interval that hasn't finished yet, the last
+        reading holds until then.  An interval is only uploaded once all of its readings are
+        known, so consecutive uploads never send the same interval.  now defaults to the current
+        time, an upload passes the time it started so all of its parts agree.
+        """
+        newest = self.ha_newest_dates.get(column)
+        resolution = const.HISTORY_RESAMPLE_SECONDS.get(column)
+        if newest is None or resolution is None:
+            return newest
+        if now is None:
+            now = datetime.now(tz=timezone.utc)
+        open_interval_start = now.timestamp() // resolution * resolution
+        return dt_util.utc_from_timestamp(open_interval_start) - timedelta(microseconds=1)
+
+    def upload_window(self, column, now=None):
+        """(start, end) timestamps of the resampling intervals the next upload of column covers.
+
+        Starts after the newest date in dynamo (None if there is nothing in dynamo yet) and ends
+        at the interval that hasn't finished yet.  None if column isn't resampled or has no
+        history.
+        """
+        resolution = const.HISTORY_RESAMPLE_SECONDS.get(column)
+        horizon = self.upload_horizon(column, now)
+        if resolution is None or horizon is None:
+            return None
+        dynamo_date = self.dynamo_newest_dates[column]
+        start = None
+        if dynamo_date is not None:
+            start = -(-dynamo_date.timestamp() // resolution) * resolution
+        return start, -(-horizon.timestamp() // resolution) * resolution
+
+    def history_days_since(self, dates):
+        """Days of history needed to cover everything newer than dates.
+
+        Columns without a date need the last const.HISTORY_DAYS.
+        """
+        now = datetime.now(tz=timezone.utc)
+        oldest = min(
+            date if date is not None else now - timedelta(days=const.HISTORY_DAYS)
+            for date in dates.values()
+        )
+        return min(const.DYNAMO_HISTORY_DAYS, max(0, (now - oldest) / timedelta(days=1)))
+
+    def build_history_chunk(self, chunk_states, chunk_windows, user_info):
+        """Convert one chunk of history states into an upload body.
+
+        chunk_windows holds the (start, end) of the resampling intervals covered by each column,
+        None for columns that aren't resampled.
+        Runs in the executor, it does not touch the event loop.
         """
         histories = {}
         constant_attributes = {}
-
-        async def debug_check_history_length(days):
-            # history_states = await history.get_state_changes(
-            #     self.hass, active_entity_id, days
-            # )
-            history_states = await history.get_state_changes_period(
-                self.hass, active_entity_id, days
-            )
-            # LOGGER.debug(
-            #     f'  history_states[0]: {history_states[0].last_updated.strftime("%Y-%m-%d %H:%M:%S")}'
-            # )
-            # LOGGER.debug(
-            #     f'  history_states[-1]: {history_states[-1].last_updated.strftime("%Y-%m-%d %H:%M:%S")}'
-            # )
-
-        for active_entity_id in missing_entities:
-            column = self.id_to_column_name_lookup[active_entity_id]
-            history_states = await history.get_state_changes(
-                self.hass, active_entity_id, const.DYNAMO_HISTORY_DAYS
+        newest_dates = {}
+        for column, states in chunk_states.items():
+            window = chunk_windows.get(column)
+            histories[column], constant_attributes[column] = history.states_to_columns(
+                self.hass, column, states, *(window or ())
             )
-            missing_new_histories_states, error = self.get_missing_new_histories_states(
-                history_states, column
-            )
-            if error:
-                raise RuntimeError(
-                    "No missing history data to upload, should not have gotten here"
+            if window is None:
+                newest_dates[column] = states[-1].last_updated
+            else:
+                newest_dates[column] = (
+                    dt_util.utc_from_timestamp(window[1]) - timedelta(microseconds=1)
                 )
+        body, content_encoding = self.encode_histories(histories, constant_attributes, user_info)
+        return HistoryChunk(
+            body=body,
+            content_encoding=content_encoding,
+            readings=sum(len(states) for states in chunk_states.values()),
+            newest_dates=newest_dates,
+        )
 
-            LOGGER.debug(f"  column: {column}")
-            if len(missing_new_histories_states) == 0:
-                LOGGER.debug(f"    ({column}) - Upload complete")
-                continue
-            LOGGER.debug(
-                f"    len(missing_new_histories_states): {len(missing_new_histories_states)}"
-            )
-            missing_new_histories_states = missing_new_histories_states[
-                : const.MAX_UPLOAD_HISTORY_READINGS
-            ]
-            LOGGER.debug(
-                f"    len(missing_new_histories_states): {len(missing_new_histories_states)}"
-            )
-            LOGGER.debug(
-                f'      {missing_new_histories_states[0].last_updated.strftime("%Y-%m-%d %H:%M:%S")}'
-            )
-            LOGGER.debug(
-                f'      {missing_new_histories_states[-1].last_updated.strftime("%Y-%m-%d %H:%M:%S")}'
-            )
+    def encode_histories(self, histories, constant_attributes, user_info):
+        """Upload body and content encoding of {column: HistoryColumn}.
 
-            histories[column], constant_attributes[column] = (
-                history.states_to_histories(
-                    self.hass, column, missing_new_histories_states
-                )
-            )
-        if histories == {}:
-            raise RuntimeError(
-                "Should not have gotten here! No missing history data to upload"
-            )
+        Runs in the executor, it does not touch the event loop.
+        """
         dynamo_data = history.histories_to_dynamo_data(
             self.hass,
             histories,
@@ -166,64 +600,235 @@ class BackendUpdateHandler:
             self.climate_entity_id,
             self.postcode,
             self.tariff,
+            user_info=user_info,
         )
-        (
-            self.dynamo_oldest_dates,
-            self.dynamo_newest_dates,
-        ) = await self.client.get_data_dates()
-        # ) = await self.client.upload_history(dynamo_data)
+        return history.encode_payload_body(dynamo_data)
+
+    async def produce_history_chunks(self, missing_states, windows, queue: asyncio.Queue):
+        """Read and convert chunks of history in the executor and put them on queue.
+
+        windows holds self.upload_window of each column, a chunk's intervals end where the next
+        chunk's start so the value held between them isn't lost.
+        queue is bounded, so reading stops while the uploads are behind.  None is put on the queue
+        once every state has been converted, or if converting failed.
+        """
+        try:
+            user_info = history.get_user_info(
+                self.hass, self.climate_entity_id, self.postcode, self.tariff
+            )
+            offsets = {column: 0 for column in missing_states}
+            while True:
+                chunk_size = self.chunk_sizer.chunk_size
+                chunk_states = {}
+                chunk_windows = {}
+                for column, states in missing_states.items():
+                    if offsets[column] >= len(states):
+                        continue
+                    # Resampling intervals are not split between chunks
+                    end = history.resample_chunk_end(
+                        column, states, offsets[column] + chunk_size
+                    )
+                    chunk_states[column] = states[offsets[column] : end]
+                    if (window := windows.get(column)) is not None:
+                        window_end = window[1]
+                        if end < len(states):
+                            resolution = const.HISTORY_RESAMPLE_SECONDS[column]
+                            window_end = (
+                                states[end].last_updated_timestamp // resolution * resolution
+                            )
+                        chunk_windows[column] = (
+                            window[0] if offsets[column] == 0 else None, window_end
+                        )
+                    offsets[column] = end
+                if not chunk_states:
+                    break
+                chunk = await self.hass.async_add_executor_job(
+                    self.build_history_chunk, chunk_states, chunk_windows, user_info
+                )
+                await queue.put(chunk)
+        except Exception:
+            # Let the consumer finish, it will get the exception when awaiting the producer
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    async def send_history_chunk(self, chunk: HistoryChunk) -> float:
+        """Send a chunk of history to the backend, returns how long the request took."""
+        return await self.client.upload_history(chunk.body, chunk.content_encoding)
+
+    async def upload_history_chunk(self, chunk: HistoryChunk):
+        """Upload one chunk of history and move the dynamo dates past it.
+
+        The time taken by the upload request, not counting logging in, is used to size the
+        following chunks.  If the upload times out or is too
+        large the chunk size is reduced and the error is raised, the upload will resume from the
+        dynamo dates on the next refresh.
+        """
+        LOGGER.debug(
+            f"    Uploading {chunk.readings} readings ({len(chunk.body)} bytes) up to {chunk.newest_dates}"
+        )
+        try:
+            seconds = await self.send_history_chunk(chunk)
+        except (
+            asyncio.TimeoutError,
+            OptisparkApiClientTimeoutError,
+            OptisparkApiClientPayloadTooLargeError,
+        ):
+            self.chunk_sizer.record_failure()
+            LOGGER.debug(f"    Upload failed, chunk size reduced to {self.chunk_sizer.chunk_size}")
+            raise
+        self.chunk_sizer.record_success(chunk.readings, seconds)
+        self.dynamo_newest_dates.update(chunk.newest_dates)
+        self.save_checkpoint()
+
+    async def upload_new_history(self, missing_entities):
+        """Upload all history states that are newer than anything in dynamo.
+
+        The history is read once and split into chunks, the number of readings per column in each
+        chunk is set by self.chunk_sizer.  Resampled columns are filled in with the last reading up
+        to the interval that hasn't finished yet.  A producer reads and converts the next chunk in the executor while
+        the previous one is being uploaded, the two are joined by a bounded queue.
+        self.dynamo_newest_dates is moved forward as each chunk is uploaded.
+        Nothing is read or moved forward if the backend has no history upload endpoint.
+        Returns the number of chunks uploaded.
+        """
+        if not self.client.history_upload_enabled:
+            return 0
+        now = datetime.now(tz=timezone.utc)
+        columns = self.entity_columns(missing_entities)
+        entities_history_states = await history.get_entities_state_changes(
+            self.hass,
+            columns,
+            self.history_days_since(
+                {column: self.dynamo_newest_dates[column] for column in columns.values()}
+            ),
+            include_start_time_state=True,
+        )
+        missing_states = {}
+        for active_entity_id, history_states in entities_history_states.items():
+            column = columns[active_entity_id]
+            missing_new_histories_states, _ = self.get_missing_new_histories_states(
+                history_states, column, now
+            )
+            LOGGER.debug(
+                f"  ({column}) len(missing_new_histories_states): {len(missing_new_histories_states)}"
+            )
+            if missing_new_histories_states:
+                missing_states[column] = missing_new_histories_states
+
+        windows = {column: self.upload_window(column, now) for column in missing_states}
+        queue = asyncio.Queue(maxsize=const.HISTORY_UPLOAD_QUEUE_SIZE)
+        producer = self.hass.async_create_task(
+            self.produce_history_chunks(missing_states, windows, queue)
+        )
+        uploaded = 0
+        try:
+            while (chunk := await queue.get()) is not None:
+                await self.upload_history_chunk(chunk)
+                uploaded += 1
+            await producer
+        finally:
+            producer.cancel()
+
+        # Everything up to the horizon that HA knew about when the upload started is now in dynamo
+        for column in columns.values():
+            horizon = self.upload_horizon(column, now)
+            dynamo_newest_date = self.dynamo_newest_dates[column]
+            if horizon is not None and (
+                dynamo_newest_date is None or dynamo_newest_date < horizon
+            ):
+                self.dynamo_newest_dates[column] = horizon
+        self.save_checkpoint()
+        return uploaded
 
     async def upload_old_history(self):
         """Upload section of old history states that are older than anything in dynamo.
 
-        self.dynamo_dates is updated so that if this function is called again a new section will be
-        uploaded.
-        const.MAX_UPLOAD_HISTORY_READINGS number of readings are uploaded to avoid long delay.
+        self.dynamo_oldest_dates is moved back past the upload, so that if this function is called
+        again a new section will be uploaded.
+        The number of readings uploaded per column is set by self.chunk_sizer.
+        Raw states are only read as far back as the recorder keeps them, and no later than the
+        oldest date in dynamo.  Once they have all been uploaded, older history is read from the
+        long-term statistics.
+        Returns whether anything was uploaded.
         """
         LOGGER.debug("Uploading portion of old history...")
         histories = {}
         constant_attributes = {}
-        for active_entity_id in self.active_entity_ids:
-            column = self.id_to_column_name_lookup[active_entity_id]
-            history_states = await history.get_state_changes(
-                self.hass, active_entity_id, const.DYNAMO_HISTORY_DAYS
+        oldest_dates = {}
+        readings = 0
+        chunk_size = self.chunk_sizer.chunk_size
+        columns = {
+            entity_id: column
+            for entity_id, column in self.entity_columns(self.active_entity_ids).items()
+            if self.dynamo_oldest_dates[column] is not None
+        }
+        raw_history_days = history.get_raw_history_days(self.hass)
+        all_history_states = await asyncio.gather(*[
+            history.get_state_changes(
+                self.hass,
+                entity_id,
+                raw_history_days,
+                history.QUERY_PROFILES[column],
+                end_time=self.dynamo_oldest_dates[column],
             )
-            missing_old_histories_states = self.get_missing_old_histories_states(
-                history_states, column
+            for entity_id, column in columns.items()
+        ])
+        for (active_entity_id, column), history_states in zip(
+            columns.items(), all_history_states
+        ):
+            missing_old_histories_states, window = self.get_missing_old_histories_states(
+                history_states, column, chunk_size
             )
 
             if len(missing_old_histories_states) == 0:
-                LOGGER.debug(f"    ({column}) - Upload complete")
+                column_history = await self.get_missing_old_statistics(
+                    active_entity_id, column, chunk_size
+                )
+                if column_history is None:
+                    LOGGER.debug(f"    ({column}) - Upload complete")
+                    continue
+                histories[column], constant_attributes[column] = column_history
+                oldest_dates[column] = dt_util.utc_from_timestamp(
+                    float(column_history[0].timestamps[0])
+                )
+                readings += len(column_history[0])
                 continue
-            missing_old_histories_states = missing_old_histories_states[
-                -const.MAX_UPLOAD_HISTORY_READINGS:
-            ]
 
-            histories[column], constant_attributes[column] = (
-                history.states_to_histories(
-                    self.hass, column, missing_old_histories_states
-                )
+            histories[column], constant_attributes[column] = await self.hass.async_add_executor_job(
+                history.states_to_columns,
+                self.hass,
+                column,
+                missing_old_histories_states,
+                *window,
             )
+            oldest_dates[column] = dt_util.utc_from_timestamp(window[0])
+            readings += len(missing_old_histories_states)
         if histories == {}:
             self.history_upload_complete = True
+            self.save_checkpoint()
             LOGGER.debug("History upload complete, recalculate heating profile...\n")
             # Now that we have all the history, recalculate heating profile
             self.manual_update = True
-            return
-        dynamo_data = history.histories_to_dynamo_data(
-            self.hass,
-            histories,
-            constant_attributes,
-            self.user_hash,
-            self.climate_entity_id,
-            self.postcode,
-            self.tariff,
+            return False
+        user_info = history.get_user_info(
+            self.hass, self.climate_entity_id, self.postcode, self.tariff
         )
-        (
-            self.dynamo_oldest_dates,
-            self.dynamo_newest_dates,
-        ) = await self.client.get_data_dates()
-        # ) = await self.client.upload_history(dynamo_data)
+        body, content_encoding = await self.hass.async_add_executor_job(
+            self.encode_histories, histories, constant_attributes, user_info
+        )
+        await self.upload_history_chunk(
+            HistoryChunk(
+                body=body,
+                content_encoding=content_encoding,
+                readings=readings,
+                newest_dates={},
+            )
+        )
+        self.dynamo_oldest_dates.update(oldest_dates)
+        LOGGER.debug(f"    Old history uploaded back to {self.dynamo_oldest_dates}")
+        self.save_checkpoint()
+        return True
 
     async def __call__(self, lambda_args):
         """Return lambda data for the current time.
@@ -233,25 +838,25 @@ class BackendUpdateHandler:
         """
         await self.client.check_location_and_device()
         thermostat = await self._check_running_manual_mode(lambda_args)
+        self.last_control = thermostat
         # Temporal Fix, heat_set_point could be None
         if thermostat.mode == 'COOLING':
             lambda_args[const.LAMBDA_SET_POINT] = thermostat.cool_set_point if thermostat.cool_set_point else 20
         else:
             lambda_args[const.LAMBDA_SET_POINT] = thermostat.heat_set_point if thermostat.heat_set_point else 20
 
-        now = datetime.now(tz=timezone.utc)
-        # This probably won't result in a smooth transition
-        if self.expire_time - now < timedelta(hours=0) or self.manual_update:
-            await self.get_heating_profile(lambda_args, thermostat_id=thermostat.thermostat_id)
+        self.last_lambda_args = dict(lambda_args)
+        if self.profile is None or self.manual_update:
+            await self.get_heating_profile(lambda_args, control=thermostat)
+        elif self.profile_expired:
+            # The previous prefetch failed, the expired profile is used until this one finishes
+            self.start_profile_prefetch()
 
-        # Updates counter
-        self.update_device_data_countdown = self.update_device_data_countdown - const.UPDATE_INTERVAL
-        if self.update_device_data_countdown <= 0:
-            LOGGER.debug('Sending device data to OptiSpark backend')
-            self.update_device_data_countdown = const.UPDATE_DEVICE_DATA_INTERVAL
-            await self._update_device_data(lambda_args)
+        self.start_device_data_updates()
 
-        return self.get_closest_time(lambda_args)
+        out = self.get_closest_time(lambda_args)
+        self.save_warm_start()
+        return out
 
     async def _update_device_data(self, lambda_args):
         await self.client.update_device_data(lambda_args)
@@ -266,8 +871,11 @@ class BackendUpdateHandler:
             return await self.client.set_manual(data)
         return thermostat_control
 
-    async def update_dynamo_dates(self, lambda_args: dict):
-        """Call the lambda function and get the oldest and newest dates in dynamodb."""
+    async def update_dynamo_dates(self, lambda_args: dict, refresh: ProfileRefresh | None = None):
+        """Call the lambda function and get the oldest and newest dates in dynamodb.
+
+        The dates are taken from refresh if given.
+        """
         # TODO: create class
         dynamo_data = {
             "user_hash": self.user_hash,
@@ -280,10 +888,21 @@ class BackendUpdateHandler:
         (
             self.dynamo_oldest_dates,
             self.dynamo_newest_dates,
-        ) = await self.client.get_data_dates()
+        ) = await self.client.get_data_dates(refresh)
 
     async def update_ha_dates(self):
-        """Get the oldest and newest dates in HA histories for active_entity_ids."""
+        """Get the oldest and newest dates in HA histories for active_entity_ids.
+
+        If the newest dates in dynamo are known, only the history since then is scanned.  Columns
+        without any newer data get the dynamo date as their newest date.
+        """
+        history_days = const.DYNAMO_HISTORY_DAYS
+        if self.dynamo_newest_dates is not None and None not in self.dynamo_newest_dates.values():
+            since = min(self.dynamo_newest_dates.values())
+            history_days = min(
+                history_days,
+                max(0, (datetime.now(tz=timezone.utc) - since) / timedelta(days=1)),
+            )
         (
             self.ha_oldest_dates,
             self.ha_newest_dates,
@@ -292,7 +911,11 @@ class BackendUpdateHandler:
             climate_entity_id=self.climate_entity_id,
             heat_pump_power_entity_id=self.heat_pump_power_entity_id,
             external_temp_entity_id=self.external_temp_entity_id,
+            history_days=history_days,
         )
+        if self.dynamo_newest_dates is not None:
+            for column, date in self.dynamo_newest_dates.items():
+                self.ha_newest_dates.setdefault(column, date)
 
     def entities_with_data_missing_from_dynamo(self):
         """Return entities with new data that needs to be uploaded.
@@ -310,7 +933,10 @@ class BackendUpdateHandler:
                 )
                 entities_missing.append(active_entity_id)
                 continue
-            if self.dynamo_newest_dates[column] < self.ha_newest_dates[column]:
+            if self.ha_newest_dates.get(column) is None:
+                # No history in HA
+                continue
+            if self.dynamo_newest_dates[column] < self.upload_horizon(column):
                 LOGGER.debug(
                     f"self.dynamo_newest_dates[{column}]: {self.dynamo_newest_dates[column]}"
                 )
@@ -325,96 +951,83 @@ class BackendUpdateHandler:
         return entities_missing
         # return False
 
-    async def get_heating_profile(self, lambda_args: dict, thermostat_id: int):
+    async def fetch_heating_profile(
+        self, lambda_args: dict, control: ThermostatControlResponse | None = None
+    ) -> ProfileIndex:
         """Fetch heating profile from Optispark Backend.
 
         Upload all new and missing data to dynamo first.
         If there is no data in dynamo, upload const.HISTORY_DAYS worth of data.
-        Records the when the heating profile expires and should be refreshed.
+        The thermostat control and graph are fetched once, the dynamo dates and the profile are
+        both taken from them.  control can be given if it has already been fetched.  If any
+        history is uploaded the graph is fetched again afterwards, so the profile includes it.
+        Without a history upload endpoint the dates aren't needed and the history isn't read.
         """
-        LOGGER.debug(f'Fetching heating profile')
-        LOGGER.debug(f"Expire time: {self.expire_time}")
-        count = 0
-        await self.update_dynamo_dates(lambda_args)
-        (
-            self.dynamo_oldest_dates,
-            self.dynamo_newest_dates,
-        ) = await self.client.get_data_dates()
-        await self.update_ha_dates()
+        refresh = None
+        if self.client.history_upload_enabled:
+            count = 0
+            uploaded = False
+            refresh = await self.reconcile_dynamo_dates(lambda_args, control)
+            await self.update_ha_dates()
 
-        while missing_entities := self.entities_with_data_missing_from_dynamo():
-            count += 1
-            LOGGER.debug(f"Updating dynamo with NEW data: round ({count})")
-            await self.upload_new_history(missing_entities)
-        LOGGER.debug("Upload of new history complete\n")
+            while missing_entities := self.entities_with_data_missing_from_dynamo():
+                count += 1
+                LOGGER.debug(f"Updating dynamo with NEW data: round ({count})")
+                if await self.upload_new_history(missing_entities):
+                    uploaded = True
+            LOGGER.debug("Upload of new history complete\n")
+            if not self.history_upload_complete:
+                # One section of the older history is uploaded with each refresh
+                if await self.upload_old_history():
+                    uploaded = True
+            if uploaded:
+                # The graph was fetched before the upload
+                refresh = None
 
-        self.lambda_results = await self.client.async_get_profile(lambda_args)
+        if refresh is None:
+            refresh = await self.client.begin_profile_refresh(control)
+        return ProfileIndex(await self.client.async_get_profile(lambda_args, refresh))
 
-        self.expire_time = self.lambda_results[const.LAMBDA_TIMESTAMP][-1]
-        # The backend will currently only update upon a new day. FIX!
-        self.expire_time = self.expire_time + timedelta(hours=1, minutes=30)
-        self.manual_update = False
-
-    async def call_lambda(self, lambda_args):
-        """Fetch heating profile from AWS Lambda.
+    async def get_heating_profile(
+        self, lambda_args: dict, control: ThermostatControlResponse | None = None
+    ):
+        """Fetch heating profile from Optispark Backend and start using it straight away.
 
-        Upload all new and missing data to dynamo first.
-        If there is no data in dynamo, upload const.HISTORY_DAYS worth of data.
+        Any prefetch in progress or scheduled is cancelled, it would fetch the same profile.
         Records the when the heating profile expires and should be refreshed.
+        The current profile is only replaced once the fetch has succeeded, so the fallback plan
+        can still use it if the backend is unavailable.
         """
-        count = 0
-        await self.update_dynamo_dates(lambda_args)
-        await self.update_ha_dates()
-        while missing_entities := self.entities_with_data_missing_from_dynamo():
-            count += 1
-            LOGGER.debug(f"Updating dynamo with NEW data: round ({count})")
-            await self.upload_new_history(missing_entities)
-        LOGGER.debug("Upload of new history complete\n")
-
-        self.lambda_results = await self.client.async_get_profile(lambda_args)
-
-        self.expire_time = self.lambda_results[const.LAMBDA_TIMESTAMP][-1]
-        # The backend will currently only update upon a new day. FIX!
-        self.expire_time = self.expire_time + timedelta(hours=1, minutes=30)
+        LOGGER.debug(f'Fetching heating profile')
+        LOGGER.debug(f"Expire time: {self.expire_time}")
+        self._cancel_profile_timers()
+        self.cancel_profile_prefetch()
+        profile = await self.fetch_heating_profile(lambda_args, control)
+        # Used straight away, even if its first time step is still in the future
+        self.profile = None
+        self.swap_profile(profile)
         self.manual_update = False
 
-    def get_closest_time(self, lambda_args):
-        """Get the closest matching time to now from the lambda data set provided."""
-        time_based_keys = [
-            const.LAMBDA_BASE_DEMAND,
-            const.LAMBDA_PRICE,
-            const.LAMBDA_TEMP_CONTROLS,
-            const.LAMBDA_OPTIMISED_DEMAND,
-        ]
-        non_time_based_keys = [
-            const.LAMBDA_BASE_COST,
-            const.LAMBDA_OPTIMISED_COST,
-            const.LAMBDA_PROJECTED_PERCENT_SAVINGS,
-        ]
+    def get_fallback_controls(self, lambda_args):
+        """Values for now from the local fallback plan, used while the backend is unavailable.
 
-        # Convert lists to {datetime: list_element}
-        my_data = {}
-        for key in time_based_keys:
-            my_data[key] = {
-                self.lambda_results[const.LAMBDA_TIMESTAMP][i]: self.lambda_results[
-                    key
-                ][i]
-                for i in range(len(self.lambda_results[key]))
-            }
-        for key in non_time_based_keys:
-            my_data[key] = self.lambda_results[key]
-
-        # Get closet datetime that is in the past
-        datetime_np = np.asarray(self.lambda_results[const.LAMBDA_TIMESTAMP])
-        filtered = datetime_np[datetime_np < datetime.now(tz=timezone.utc)]
-        closest_past_date = filtered.max()
-
-        out = {}
-        for key in time_based_keys:
-            out[key] = my_data[key][closest_past_date]
+        Returns None if there is no cached heating profile to plan from.
+        """
+        if self.profile is None:
+            return None
+        out = fallback.fallback_controls(
+            self.profile, lambda_args, datetime.now(tz=timezone.utc)
+        )
+        if lambda_args[const.LAMBDA_OUTSIDE_RANGE]:
+            out[const.LAMBDA_TEMP_CONTROLS] = lambda_args[const.LAMBDA_SET_POINT]
+        return out
 
-        for key in non_time_based_keys:
-            out[key] = my_data[key]
+    def get_closest_time(self, lambda_args):
+        """Get the closest matching time to now from the heating profile."""
+        now = datetime.now(tz=timezone.utc)
+        if self.next_profile is not None and self.next_profile.starts_before(now):
+            self.profile, self.next_profile = self.next_profile, None
+        out = self.profile.lookup(now, interpolate=const.PROFILE_INTERPOLATION)
 
         if lambda_args[const.LAMBDA_OUTSIDE_RANGE]:
             # We're outside of the temp range so simply set the set point to whatever the user has
@@ -0,0 +1,81 @@
+"""Size the history upload chunks from measured upload times.
+
+Chunks grow while uploads finish under the target time and shrink when they take too long, time
+out or are rejected for being too large.
+"""
+from __future__ import annotations
+
+from . import const
+
+# How much the chunk size grows after a fast upload
+GROWTH_FACTOR = 1.5
+# How much the chunk size shrinks after a timeout or a too large payload
+SHRINK_FACTOR = 0.5
+# Weight of the newest measurement in the throughput average
+THROUGHPUT_SMOOTHING = 0.3
+
+
+class UploadChunkSizer:
+    """Number of readings to send per history upload chunk."""
+
+    def __init__(
+        self,
+        initial: int = const.MAX_UPLOAD_HISTORY_READINGS,
+        minimum: int = const.UPLOAD_CHUNK_MIN_READINGS,
+        maximum: int = const.UPLOAD_CHUNK_MAX_READINGS,
+        target_seconds: float = const.UPLOAD_CHUNK_TARGET_SECONDS,
+    ) -> None:
+        """Init."""
+        self._minimum = minimum
+        self._maximum = maximum
+        self._target_seconds = target_seconds
+        self._chunk_size = self._clamp(initial)
+        self._throughput = None  # readings per second
+        self._last_request_seconds = None
+        self._failures = 0
+
+    def _clamp(self, chunk_size) -> int:
+        return int(min(self._maximum, max(self._minimum, chunk_size)))
+
+    @property
+    def chunk_size(self) -> int:
+        """Readings to put in the next chunk."""
+        return self._chunk_size
+
+    @property
+    def throughput(self) -> float | None:
+        """Smoothed upload throughput in readings per second, None until something is uploaded."""
+        return self._throughput
+
+    def record_success(self, readings: int, seconds: float):
+        """Update the chunk size after readings were uploaded in seconds."""
+        self._last_request_seconds = seconds
+        if readings == 0:
+            return
+        throughput = readings / max(seconds, 1e-3)
+        if self._throughput is None:
+            self._throughput = throughput
+        else:
+            self._throughput += THROUGHPUT_SMOOTHING * (throughput - self._throughput)
+        if seconds < self._target_seconds:
+            self._chunk_size = self._clamp(self._chunk_size * GROWTH_FACTOR)
+        else:
+            # Aim for the target time at the measured throughput
+            self._chunk_size = self._clamp(throughput * self._target_seconds)
+
+    def record_failure(self):
+        """Shrink the chunk size after a timeout or a payload that was too large."""
+        self._failures += 1
+        self._chunk_size = self._clamp(self._chunk_size * SHRINK_FACTOR)
+
+    def as_dict(self) -> dict:
+        """State of the sizer for diagnostics."""
+        return {
+            "chunk_size": self._chunk_size,
+            "minimum": self._minimum,
+            "maximum": self._maximum,
+            "target_seconds": self._target_seconds,
+            "throughput": self._throughput,
+            "last_request_seconds": self._last_request_seconds,
+            "failures": self._failures,
+        }
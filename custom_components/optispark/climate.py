@@ -8,6 +8,7 @@ from homeassistant.components.climate import (
     HVACMode,
 )
 from homeassistant.const import UnitOfTemperature
+from homeassistant.core import callback
 
 from . import const
 from .coordinator import OptisparkDataUpdateCoordinator
@@ -23,10 +24,8 @@ ENTITY_DESCRIPTIONS = (
 )
 
 
-async def async_setup_entry(hass, entry, async_add_devices):
-    """Set up the climate platform."""
-    coordinator: OptisparkDataUpdateCoordinator = hass.data[const.DOMAIN][entry.entry_id]
-    thermostat_info: ThermostatInfo = await coordinator.fetch_thermostat_info()
+def get_target_temp(thermostat_info: ThermostatInfo | None) -> float:
+    """Target temperature of the thermostat, 20 if it isn't known."""
     target_temp = 20
     if thermostat_info is not None:
         if thermostat_info.hvac_mode == HVACMode.COOL and thermostat_info.target_temp_low:
@@ -35,12 +34,21 @@ async def async_setup_entry(hass, entry, async_add_devices):
             target_temp = thermostat_info.target_temp_high
         elif thermostat_info.hvac_mode == HVACMode.HEAT_COOL:
             target_temp = thermostat_info.target_temp_high
+    return target_temp
+
 
+async def async_setup_entry(hass, entry, async_add_devices):
+    """Set up the climate platform.
+
+    The entity starts with the cached thermostat info, the backend is not waited for.  If nothing
+    is cached the entity takes the info from the coordinator once the first refresh has fetched it.
+    """
+    coordinator: OptisparkDataUpdateCoordinator = hass.data[const.DOMAIN][entry.entry_id]
     async_add_devices(
         OptisparkClimate(
             coordinator=coordinator,
             entity_description=entity_description,
-            target_temp=target_temp
+            target_temp=get_target_temp(coordinator.thermostat_info)
         )
         for entity_description in ENTITY_DESCRIPTIONS
     )
@@ -62,6 +70,16 @@ class OptisparkClimate(OptisparkEntity, ClimateEntity):
         self._target_temperature_high = 25
         self._target_temperature_low = 20
         self._hvac_mode = HVACMode.HEAT
+        # Whether the target temperature has been taken from the thermostat info
+        self._has_thermostat_info = coordinator.thermostat_info is not None
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Take the target temperature from the thermostat info the first refresh fetched."""
+        if not self._has_thermostat_info and self.coordinator.thermostat_info is not None:
+            self._has_thermostat_info = True
+            self._target_temperature = get_target_temp(self.coordinator.thermostat_info)
+        super()._handle_coordinator_update()
 
     async def async_set_hvac_mode(self, hvac_mode):
         """Such as heat, cool, both..."""
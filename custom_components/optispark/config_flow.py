@@ -4,9 +4,8 @@ from __future__ import annotations
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.helpers.selector import selector
-from geopy.adapters import AioHTTPAdapter
-from geopy.geocoders import Nominatim
 import hashlib
+import importlib
 import traceback
 
 # from .api import (
@@ -19,6 +18,19 @@ from . import get_entity, get_username
 from .backend.exception.exceptions import OptisparkApiClientPostcodeError, OptisparkApiClientUnitError
 
 
+async def async_nominatim(hass, user_agent):
+    """Nominatim geocoder using aiohttp.
+
+    geopy is only imported when the postcode is looked up, not every time the config flow is
+    loaded.  It is imported in Home Assistant's import executor, not on the event loop.
+    """
+    adapters = await hass.async_add_import_executor_job(importlib.import_module, "geopy.adapters")
+    geocoders = await hass.async_add_import_executor_job(
+        importlib.import_module, "geopy.geocoders"
+    )
+    return geocoders.Nominatim(user_agent=user_agent, adapter_factory=adapters.AioHTTPAdapter)
+
+
 class OptisparkFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
     """Config flow for Optispark."""
 
@@ -103,10 +115,7 @@ class OptisparkFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
         if postcode_required:
             # Get post code from homeassistant
             try:
-                async with Nominatim(
-                    user_agent=self.flow_id,
-                    adapter_factory=AioHTTPAdapter,
-                ) as geolocator:
+                async with await async_nominatim(self.hass, self.flow_id) as geolocator:
                     location = await geolocator.reverse((
                         self.hass.config.latitude,
                         self.hass.config.longitude))
@@ -187,11 +196,7 @@ class OptisparkFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
         Returns formatted postcode.
         """
         try:
-            async with Nominatim(
-                #user_agent="specify_your_app_name_here",
-                user_agent=self.flow_id,
-                adapter_factory=AioHTTPAdapter,
-            ) as geolocator:
+            async with await async_nominatim(self.hass, self.flow_id) as geolocator:
                 location = await geolocator.geocode(postcode)
                 postcode = location.raw['name']
             if postcode == '' or postcode is None:
@@ -1,13 +1,82 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
 import json
 import os
+from string import Formatter
+from types import MappingProxyType
 
 from .const import LOGGER
 
 
+class EndpointTemplate:
+    """URL of a backend endpoint, with its {placeholders} parsed when the config is loaded."""
+
+    __slots__ = ("_template", "_fields")
+
+    def __init__(self, template: str):
+        """Init."""
+        self._template = template
+        self._fields = frozenset(
+            field for _, field, _, _ in Formatter().parse(template) if field is not None
+        )
+
+    def format(self, **params) -> str:
+        """URL with the placeholders replaced by params."""
+        if not self._fields:
+            return self._template
+        missing = self._fields - params.keys()
+        if missing:
+            raise KeyError(f"{self._template} needs {', '.join(sorted(missing))}")
+        return self._template.format_map(params)
+
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    """{dotted path: value} of every value in data that isn't a dict."""
+    out = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, f"{path}."))
+        else:
+            out[path] = value
+    return out
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """One version of the configuration, a reload replaces the whole snapshot.
+
+    A request takes the snapshot once and reads everything from it, so it never mixes the old
+    and new configuration.
+    """
+
+    config_data: Mapping
+    endpoints: Mapping
+
+    def get(self, path, default=None):
+        """Value at the dotted path."""
+        return self.config_data.get(path, default)
+
+    def url(self, path, **params) -> str:
+        """URL of the endpoint at path, with its placeholders replaced by params."""
+        return self.endpoints[path].format(**params)
+
+    @property
+    def verify_ssl(self) -> bool:
+        """Whether the backend's certificate is verified."""
+        return self.config_data.get("backend.verifySSL", True)
+
+
 class ConfigurationService:
+    """Configuration file, flattened into a read only {dotted path: value} mapping.
+
+    Every string under "backend" other than baseUrl is an endpoint, each is compiled into an
+    EndpointTemplate with the base URL in front of it.  The mapping and the templates are held in
+    one ConfigSnapshot, a reload builds a new one and swaps it in with a single assignment.
+    """
+
     _instance = None
     _initialized = False
-    _cache = {}
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -15,17 +84,20 @@ class ConfigurationService:
         return cls._instance
 
     def __init__(self, config_file=None):
+        # The file is read by load or async_load, not when the module is imported
         if config_file and not ConfigurationService._initialized:
             self.config_file = config_file
-            self.config_data = self._load_config()
-            ConfigurationService._initialized = True
+            self._snapshot = ConfigSnapshot(MappingProxyType({}), MappingProxyType({}))
+            self._mtime = None
+
+    @property
+    def file_path(self):
+        """Absolute path of the configuration file."""
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), self.config_file)
 
     def _load_config(self):
-        script_path = os.path.abspath(__file__)
-        parent_dir = os.path.dirname(script_path)
-        file_path = os.path.join(parent_dir, self.config_file)
         try:
-            with open(file_path, "r") as file:
+            with open(self.file_path, "r") as file:
                 return json.load(file)
         except FileNotFoundError:
             LOGGER.error(f"Error: The configuration file {self.config_file} was not found.")
@@ -36,24 +108,70 @@ class ConfigurationService:
             )
             return {}
 
-    def get(self, path, default=None):
+    def _read(self):
+        """Read and compile the configuration file."""
+        try:
+            self._mtime = os.stat(self.file_path).st_mtime
+        except OSError:
+            self._mtime = None
+        config_data = flatten(self._load_config())
+        base_url = config_data.get("backend.baseUrl", "")
+        endpoints = {
+            path: EndpointTemplate(f"{base_url}/{endpoint}")
+            for path, endpoint in config_data.items()
+            if path.startswith("backend.") and path != "backend.baseUrl"
+            and isinstance(endpoint, str)
+        }
+        self._snapshot = ConfigSnapshot(MappingProxyType(config_data), MappingProxyType(endpoints))
+
+    def load(self):
+        """Read the configuration file, only the first call reads it.
+
+        Blocking, use async_load from the event loop.
+        """
+        if ConfigurationService._initialized:
+            return
+        self._read()
+        ConfigurationService._initialized = True
+
+    async def async_load(self, hass):
+        """Read the configuration file in the executor, only the first call reads it."""
+        if not ConfigurationService._initialized:
+            await hass.async_add_executor_job(self.load)
+
+    def reload_if_changed(self) -> bool:
+        """Read the configuration file again if its modification time has changed.
+
+        Blocking, use async_reload_if_changed from the event loop.
+        Returns whether it was reloaded.
+        """
+        try:
+            mtime = os.stat(self.file_path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._read()
+        LOGGER.info(f"Configuration reloaded, backend: {self.get('backend.baseUrl')}")
+        return True
+
+    async def async_reload_if_changed(self, hass) -> bool:
+        """Run reload_if_changed in the executor."""
+        return await hass.async_add_executor_job(self.reload_if_changed)
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """Current configuration, take it once per request and read everything from it."""
         if not ConfigurationService._initialized:
-            raise Exception("ConfigurationService must be initialized with a config file before use.")
-
-        if path in ConfigurationService._cache:
-            return ConfigurationService._cache[path]
-
-        keys = path.split('.')
-        data = self.config_data
-        for key in keys:
-            if isinstance(data, dict):
-                data = data.get(key, default)
-            else:
-                data = default
-
-        # Cache the result before returning
-        ConfigurationService._cache[path] = data
-        return data
+            raise Exception("ConfigurationService must be loaded with a config file before use.")
+        return self._snapshot
+
+    def get(self, path, default=None):
+        return self.snapshot.get(path, default)
+
+    def url(self, path, **params) -> str:
+        """URL of the endpoint at path, with its placeholders replaced by params."""
+        return self.snapshot.url(path, **params)
 
 
 config_service = ConfigurationService(config_file='./config/config.json')
@@ -17,6 +17,7 @@ LAMBDA_BASE_COST = 'base_cost'
 LAMBDA_OPTIMISED_COST = 'optimised_cost'
 LAMBDA_PROJECTED_PERCENT_SAVINGS = 'projected_percent_savings'
 LAMBDA_HOME_ASSISTANT_VERSION = 'home_assistant_version'
+LAMBDA_EXTERNAL_TEMP = 'external_temp'
 # Lambda parameters
 LAMBDA_SET_POINT = 'temp_set_point'
 LAMBDA_TEMP_RANGE = 'temp_range'
@@ -31,13 +32,61 @@ LAMBDA_TEMP_CHANGED = 'temp_changed'
 
 HISTORY_DAYS = 28  # the number of days initially required by our algorithm
 DYNAMO_HISTORY_DAYS = 365*2
-MAX_UPLOAD_HISTORY_READINGS = 5000
+MAX_UPLOAD_HISTORY_READINGS = 5000  # initial size of the history upload chunks
+UPLOAD_CHUNK_MIN_READINGS = 500
+UPLOAD_CHUNK_MAX_READINGS = 50000
+UPLOAD_CHUNK_TARGET_SECONDS = 5
+UPLOAD_CHUNK_TIMEOUT = 60  # seconds, a chunk that takes longer is retried smaller
+HISTORY_UPLOAD_QUEUE_SIZE = 2  # chunks converted ahead of the upload
+HISTORY_PAYLOAD_FORMAT = 'columnar-v1'
+HISTORY_PAYLOAD_ENCODING = 'gzip'  # None, 'gzip' or 'zstd'
 DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER = 'heat_pump_power'
 DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE = 'external_temperature'
 DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY = 'climate_entity'
+# Resolution (in seconds) that each column is resampled to before upload, None uploads every reading
+HISTORY_RESAMPLE_SECONDS = {
+    DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER: 5 * 60,
+    DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE: 5 * 60,
+    DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY: 5 * 60,
+}
+# Old history beyond the recorder's raw state retention is read from the long-term statistics.
+# The climate entity has no statistics.
+HISTORY_STATISTICS_COLUMNS = [
+    DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER,
+    DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE,
+]
+HISTORY_STATISTICS_PERIOD = 'hour'
+
+HISTORY_CHECKPOINT_STORAGE_VERSION = 1
+HISTORY_CHECKPOINT_STORAGE_KEY = f'{DOMAIN}.history_checkpoint'
+HISTORY_CHECKPOINT_SAVE_DELAY = 10  # seconds
+HISTORY_CHECKPOINT_RECONCILE_INTERVAL = 6 * 60 * 60  # seconds
+WARM_START_STORAGE_VERSION = 1
+WARM_START_STORAGE_KEY = f'{DOMAIN}.warm_start'
+WARM_START_SAVE_DELAY = 30  # seconds
 
 UPDATE_INTERVAL = 10
 UPDATE_DEVICE_DATA_INTERVAL = 300
+# Added to the last time step of a heating profile to get its expiry time
+PROFILE_EXPIRY_MARGIN = 90 * 60  # seconds
+# The next heating profile is fetched in the background this long before the current one expires
+PROFILE_PREFETCH_LEAD = 15 * 60  # seconds
+# Longest time between updates that the accumulator sensors integrate over
+ACCUMULATOR_MAX_GAP = 5 * 60  # seconds
+# Set point changes made within this time of each other are sent to the backend together
+SET_POINT_DEBOUNCE = 1.5  # seconds
+# Ramp the target temperature linearly between heating profile time steps
+PROFILE_INTERPOLATION = True
+# The heat pump target temperature is only changed if it is off by at least this much
+TEMPERATURE_WRITE_DEADBAND = 0.25  # °C
+# Reload config/config.json on each update if it has been modified, e.g. to point backend.baseUrl
+# at a local backend without restarting Home Assistant
+CONFIG_HOT_RELOAD = False
+# Local set-point plan used while the backend is unavailable
+FALLBACK_HORIZON = 24 * 60 * 60  # seconds
+FALLBACK_STEP = 30 * 60  # seconds, used when the cached profile has a single time step
+FALLBACK_COLD_TEMP = 0  # °C, no setback below this external temperature
+FALLBACK_MILD_TEMP = 12  # °C, full setback above this external temperature
 
 SWITCH_KEY = 'enable_optispark'
 
@@ -3,10 +3,12 @@
 from __future__ import annotations
 
 from datetime import timedelta, datetime, timezone
+import asyncio
 import traceback
 
 from homeassistant.core import HomeAssistant
 import homeassistant.const
+from homeassistant.helpers.debounce import Debouncer
 from homeassistant.helpers.update_coordinator import (
     DataUpdateCoordinator,
     UpdateFailed,
@@ -33,6 +35,8 @@ from homeassistant.const import UnitOfTemperature
 
 from .domain.thermostat.thermostat_info import ThermostatInfo
 from .domain.control.control_info import ControlInfo
+from .utils import to_thermostat_info
+from .configuration_service import config_service
 from .backend.exception.exceptions import OptisparkApiClientAuthenticationError, OptisparkApiClientError
 
 
@@ -73,6 +77,9 @@ class OptisparkDataUpdateCoordinator(DataUpdateCoordinator):
         self._external_temp_entity_id = external_temp_entity_id
         self._switch_enabled = False  # The switch will set this at startup
         self._available = False
+        self._fallback_active = False
+        # Cached by fetch_thermostat_info or taken from the first refresh, None until then
+        self.thermostat_info: ThermostatInfo | None = None
         self._lambda_args = {
             const.LAMBDA_SET_POINT: 20.0,
             const.LAMBDA_TEMP_RANGE: 2.0,
@@ -87,6 +94,18 @@ class OptisparkDataUpdateCoordinator(DataUpdateCoordinator):
             const.LAMBDA_CITY: self._city,
         }
         self._previous_lambda_args = self._lambda_args
+        # Set when the set point has changed but hasn't been sent to the backend yet
+        self._set_point_changed = False
+        self._set_manual_task = None
+        # Futures of the callers waiting for the set point to be sent, resolved with its result
+        self._set_point_waiters: list[asyncio.Future] = []
+        self._lambda_args_debouncer = Debouncer(
+            hass,
+            LOGGER,
+            cooldown=const.SET_POINT_DEBOUNCE,
+            immediate=False,
+            function=self._async_apply_lambda_args,
+        )
         self._lambda_update_handler = BackendUpdateHandler(
             hass=self.hass,
             client=self.client,
@@ -99,12 +118,51 @@ class OptisparkDataUpdateCoordinator(DataUpdateCoordinator):
             country=self._country,
             city=self._city,
             tariff=self._tariff,
+            request_refresh=self.async_request_refresh,
         )
 
+    async def async_restore_warm_start(self):
+        """Restore the state saved after the last refresh before a restart.
+
+        The entities start with the saved thermostat info and the values of the saved heating
+        profile for now, rather than waiting for the backend.  Both are replaced once the first
+        refresh has fetched fresh data.  Nothing is written to the heat pump.
+        """
+        control = await self._lambda_update_handler.async_load_warm_start()
+        if control is None:
+            return
+        self.thermostat_info = to_thermostat_info(control)
+        profile = self.profile
+        if profile is None:
+            return
+        try:
+            self.data = profile.lookup(
+                datetime.now(tz=timezone.utc), interpolate=const.PROFILE_INTERPOLATION
+            )
+        except ValueError:
+            return
+        self._available = True
+
+    async def async_shutdown(self) -> None:
+        """Cancel the backend update handler timers and pending set point changes."""
+        self._lambda_args_debouncer.async_shutdown()
+        if self._set_manual_task is not None:
+            self._set_manual_task.cancel()
+        for waiter in self._set_point_waiters:
+            waiter.cancel()
+        self._set_point_waiters = []
+        self._lambda_update_handler.async_shutdown()
+        await super().async_shutdown()
+
+    def diagnostics(self) -> dict:
+        """State of the backend communication for diagnostics."""
+        return self._lambda_update_handler.diagnostics()
+
     async def fetch_thermostat_info(self) -> ThermostatInfo:
-        """Fetchs thermostat info from OptiSpark backend"""
+        """Fetchs thermostat info from OptiSpark backend and caches it in self.thermostat_info."""
 
-        return await self.client.get_thermostat_info()
+        self.thermostat_info = await self.client.get_thermostat_info()
+        return self.thermostat_info
 
     def convert_sensor_from_farenheit(self, entity, temp):
         """Ensure that the sensor returns values in Celcius.
@@ -157,7 +215,10 @@ class OptisparkDataUpdateCoordinator(DataUpdateCoordinator):
         climate_entity = get_entity(self.hass, self._climate_entity_id)
 
         try:
-            if self.heat_pump_target_temperature == temp:
+            target_temperature = self.heat_pump_target_temperature
+            if target_temperature is not None and abs(
+                self.convert_climate_from_farenheit(climate_entity, target_temperature) - temp
+            ) < const.TEMPERATURE_WRITE_DEADBAND:
                 return
             LOGGER.debug("Change in target temperature!")
             supports_target_temperature_range = (
@@ -204,16 +265,27 @@ class OptisparkDataUpdateCoordinator(DataUpdateCoordinator):
         return entities
 
     def enable_disable_entities(self, entities: list[RegistryEntry], enable: bool):
-        """Enable/Disable all entities given in the list."""
+        """Enable/Disable all entities given in the list.
+
+        Only entities whose state needs to change are updated.  Enabling only affects entities
+        that were disabled by the integration, entities disabled by the user stay disabled.
+        Home Assistant coalesces the registry changes into a single save and a single reload of
+        the config entry.
+        """
         entity_register: EntityRegistry = entity_registry.async_get(self.hass)
-        enable_lookup = {
-            True: None,
-            False: entity_registry.RegistryEntryDisabler.INTEGRATION,
-        }
-        for entity in entities:
-            entity_register.async_update_entity(
-                entity.entity_id, disabled_by=enable_lookup[enable]
-            )
+        if enable:
+            changed = [
+                entity for entity in entities
+                if entity.disabled_by == entity_registry.RegistryEntryDisabler.INTEGRATION
+            ]
+            disabled_by = None
+        else:
+            changed = [entity for entity in entities if entity.disabled_by is None]
+            disabled_by = entity_registry.RegistryEntryDisabler.INTEGRATION
+        for entity in changed:
+            entity_register.async_update_entity(entity.entity_id, disabled_by=disabled_by)
+        if changed:
+            LOGGER.debug(f"{'Enabled' if enable else 'Disabled'} {len(changed)} entities")
 
     def enable_disable_integration(self, enable: bool):
         """Enable/Disable all entities other than the switch."""
@@ -223,27 +295,76 @@ class OptisparkDataUpdateCoordinator(DataUpdateCoordinator):
         if enable is False:
             # The coordinator is available once data is fetched
             self._available = False
+            # Stop sending device data, it restarts with the next update
+            self._lambda_update_handler.async_shutdown()
         # self.always_update = enable
 
     async def async_set_lambda_args(self, lambda_args):
         """Update the lambda arguments.
 
-        To be called from entities.
+        To be called from entities.  Changes made within const.SET_POINT_DEBOUNCE seconds are
+        coalesced into a single backend write and refresh.  A set point change cancels the write of
+        any earlier set point that is still in flight.
+        Waits until the set point has been sent and raises if sending it failed.
         """
         self._lambda_args = lambda_args
-        self._lambda_update_handler.manual_update = True
+        waiter = None
+        if lambda_args.get(const.LAMBDA_TEMP_CHANGED) is True:
+            self._set_point_changed = True
+            waiter = self.hass.loop.create_future()
+            self._set_point_waiters.append(waiter)
+            if self._set_manual_task is not None and not self._set_manual_task.done():
+                self._set_manual_task.cancel()
+        # Dropped if the debouncer is running _async_apply_lambda_args, which then sends this
+        # set point before it returns
+        await self._lambda_args_debouncer.async_call()
+        if waiter is not None:
+            await waiter
+
+    async def _async_set_manual(self, lambda_args):
+        """Send the set point to the backend."""
+        info = ControlInfo(
+            set_point=lambda_args[const.LAMBDA_SET_POINT],
+            mode=lambda_args[const.LAMBDA_HEAT_PUMP_MODE_RAW]
+        )
+        thermostat_control_response = await self.client.set_manual(info)
+        if not thermostat_control_response:
+            LOGGER.error(f'Unable to update thermostat control on OptisPark backend')
 
-        temp = lambda_args[const.LAMBDA_SET_POINT]
-        if lambda_args[const.LAMBDA_TEMP_CHANGED] is True:
-            info = ControlInfo(
-                set_point=temp,
-                mode=lambda_args[const.LAMBDA_HEAT_PUMP_MODE_RAW]
-            )
-            thermostat_control_response = await self.client.set_manual(info)
-            if not thermostat_control_response:
-                LOGGER.error(f'Unable to update thermostat control on OptisPark backend')
-        self._previous_lambda_args = lambda_args
-        await self.async_request_update()
+    async def _async_apply_lambda_args(self):
+        """Send the latest lambda arguments to the backend and refresh.
+
+        Called by the debouncer once the changes have settled.  Set points changed while this is
+        running are sent before it returns, the debouncer drops calls made while it is running.
+        """
+        while True:
+            lambda_args = self._lambda_args
+            self._lambda_update_handler.manual_update = True
+            if self._set_point_changed:
+                self._set_point_changed = False
+                waiters, self._set_point_waiters = self._set_point_waiters, []
+                self._set_manual_task = self.hass.async_create_task(
+                    self._async_set_manual(dict(lambda_args))
+                )
+                await asyncio.wait([self._set_manual_task])
+                if self._set_manual_task.cancelled():
+                    # Superseded by a newer set point, its callers wait for that one instead
+                    self._set_point_waiters = waiters + self._set_point_waiters
+                    continue
+                err = self._set_manual_task.exception()
+                for waiter in waiters:
+                    if waiter.done():
+                        continue
+                    if err is None:
+                        waiter.set_result(None)
+                    else:
+                        waiter.set_exception(err)
+                if err is not None:
+                    LOGGER.error(f'Unable to update thermostat control on OptisPark backend: {err}')
+            self._previous_lambda_args = lambda_args
+            await self.async_request_update()
+            if not self._set_point_changed:
+                return
 
     @property
     def postcode(self):
@@ -324,6 +445,11 @@ class OptisparkDataUpdateCoordinator(DataUpdateCoordinator):
 
         return self._lambda_args
 
+    @property
+    def profile(self):
+        """Heating profile currently in use, None until the first one has been fetched."""
+        return self._lambda_update_handler.profile
+
     @property
     def available(self):
         """Is there data available for the entities."""
@@ -343,17 +469,37 @@ class OptisparkDataUpdateCoordinator(DataUpdateCoordinator):
         Returns the current setting for the heat pump for the current moment.
         Entire days heat pump profile will be stored if it's out of date.
         """
+        if const.CONFIG_HOT_RELOAD:
+            await config_service.async_reload_if_changed(self.hass)
         if self._switch_enabled is False:
             # Integration is disabled, don't call lambda
             return self.data
         try:
             # self.lambda_args[const.LAMBDA_OPTIMISED_DEMAND] =
             data = await self._lambda_update_handler(self.lambda_args)
+            if self.thermostat_info is None and (
+                control := self._lambda_update_handler.last_control
+            ) is not None:
+                # The climate entity picks it up, rather than asking the backend itself
+                self.thermostat_info = to_thermostat_info(control)
             await self.update_heat_pump_temperature(data)
             self._available = True
+            if self._fallback_active:
+                LOGGER.info("OptiSpark backend available again")
+                self._fallback_active = False
             return data
         except OptisparkApiClientAuthenticationError as exception:
             raise ConfigEntryAuthFailed(exception) from exception
         except OptisparkApiClientError as exception:
-            raise UpdateFailed(exception) from exception
+            data = self._lambda_update_handler.get_fallback_controls(self._lambda_args)
+            if data is None:
+                raise UpdateFailed(exception) from exception
+            if not self._fallback_active:
+                LOGGER.warning(
+                    f"OptiSpark backend unavailable, using the local fallback plan: {exception}"
+                )
+                self._fallback_active = True
+            await self.update_heat_pump_temperature(data)
+            self._available = True
+            return data
 
@@ -0,0 +1,20 @@
+"""Diagnostics support for Optispark."""
+from __future__ import annotations
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .coordinator import OptisparkDataUpdateCoordinator
+
+TO_REDACT = {"user_hash", "address", "postcode", "city"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict:
+    """Return diagnostics for a config entry."""
+    coordinator: OptisparkDataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "backend": coordinator.diagnostics(),
+    }
@@ -5,6 +5,7 @@ Ensures that all entities that inherit this are grouped together into the same d
 
 from __future__ import annotations
 
+from homeassistant.core import callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
@@ -26,6 +27,8 @@ class OptisparkEntity(CoordinatorEntity):
     """BlueprintEntity class."""
 
     _attr_attribution = ATTRIBUTION
+    # Signature of the state last written to the state machine
+    _last_state_signature = None
 
     def __init__(self, coordinator: OptisparkDataUpdateCoordinator) -> None:
         """Initialize."""
@@ -37,6 +40,37 @@ class OptisparkEntity(CoordinatorEntity):
             manufacturer=NAME,
         )
 
+    def _state_signature(self):
+        """Everything that is written to the state machine, compared between updates."""
+        return (
+            self.available,
+            self.state,
+            self.state_attributes,
+            self.extra_state_attributes,
+        )
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state only if it has changed since the last coordinator update.
+
+        The coordinator updates every const.UPDATE_INTERVAL seconds, usually with the same values.
+        Writing them again would only add identical rows to the recorder.
+        """
+        if self._state_signature() == self._last_state_signature:
+            return
+        self.async_write_ha_state()
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        """Write the state and record its signature.
+
+        Entities also write their state outside of coordinator updates, the signature is
+        recorded for every write so the next coordinator update compares against what was
+        actually written.
+        """
+        self._last_state_signature = self._state_signature()
+        super().async_write_ha_state()
+
     @property
     def unique_id(self):
         """Return unique id for the Number."""
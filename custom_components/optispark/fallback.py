@@ -0,0 +1,86 @@
+"""Local set-point plan used while the OptiSpark backend is unavailable.
+
+Prices and external temperatures are taken from the last heating profile, matched by time of day,
+so the plan follows the usual daily pattern of the tariff.  The house is heated a little more
+when electricity is cheap and a little less when it is expensive, always staying inside the
+user's temp_range.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+import numpy as np
+
+from . import const
+from .profile import ProfileIndex
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def time_of_day_values(profile: ProfileIndex, values: np.ndarray, timestamps: np.ndarray):
+    """Values of the profile time step with the closest earlier time of day to each timestamp.
+
+    Times of day before the first time step wrap around to the last one.
+    """
+    time_of_day = profile.timestamps % SECONDS_PER_DAY
+    order = np.argsort(time_of_day, kind="stable")
+    idx = np.searchsorted(time_of_day[order], timestamps % SECONDS_PER_DAY, side="right") - 1
+    # idx of -1 selects the last time of day
+    return values[order][idx]
+
+
+def plan_set_points(prices, external_temps, set_point, temp_range):
+    """Set point for each time step from its price rank.
+
+    The cheapest step is set to set_point + temp_range / 2 and the most expensive to
+    set_point - temp_range / 2.  The setback is reduced as it gets colder outside, because
+    recovering from it costs more, and is removed at const.FALLBACK_COLD_TEMP.
+    """
+    if len(prices) == 0:
+        return np.array([], dtype=np.float64)
+    # Unknown prices are treated as average
+    known = ~np.isnan(prices)
+    prices = np.where(known, prices, prices[known].mean() if known.any() else 0)
+    rank = prices.argsort(kind="stable").argsort() / max(len(prices) - 1, 1)
+    offset = (0.5 - rank) * temp_range
+    mildness = np.clip(
+        (external_temps - const.FALLBACK_COLD_TEMP)
+        / (const.FALLBACK_MILD_TEMP - const.FALLBACK_COLD_TEMP),
+        0,
+        1,
+    )
+    # Unknown external temperatures get the full setback
+    mildness = np.where(np.isnan(mildness), 1, mildness)
+    offset = np.where(offset < 0, offset * mildness, offset)
+    return set_point + offset
+
+
+def fallback_controls(profile: ProfileIndex, lambda_args: dict, now: datetime) -> dict:
+    """Values for now, in the same format as ProfileIndex.lookup, from a local plan.
+
+    The plan covers const.FALLBACK_HORIZON seconds, in steps the size of the cached profile's.
+    """
+    if len(profile.timestamps) > 1:
+        step = float(np.median(np.diff(profile.timestamps)))
+    else:
+        step = const.FALLBACK_STEP
+    timestamps = now.timestamp() + np.arange(0, const.FALLBACK_HORIZON, step)
+
+    prices = time_of_day_values(profile, profile.series(const.LAMBDA_PRICE), timestamps)
+    external_temps = time_of_day_values(
+        profile, profile.series(const.LAMBDA_EXTERNAL_TEMP), timestamps
+    )
+    set_points = plan_set_points(
+        prices,
+        external_temps,
+        lambda_args[const.LAMBDA_SET_POINT],
+        lambda_args[const.LAMBDA_TEMP_RANGE],
+    )
+
+    out = {
+        key: time_of_day_values(profile, np.asarray(values, dtype=object), timestamps[:1])[0]
+        for key, values in profile.values.items()
+    }
+    out[const.LAMBDA_TEMP_CONTROLS] = float(set_points[0])
+    out.update(profile.constants)
+    return out
@@ -7,18 +7,28 @@ All values in °F are converted to °C
 All values in W are converted to kW
 """
 
+from homeassistant.components.recorder.history import get_last_state_changes
 from homeassistant.components.recorder.history import get_significant_states
 from homeassistant.components.recorder.history import state_changes_during_period
+from homeassistant.components.recorder.statistics import statistics_during_period
 
 from homeassistant.components.recorder.util import get_instance
-from homeassistant.const import UnitOfTemperature
+from homeassistant.const import COMPRESSED_STATE_LAST_UPDATED, COMPRESSED_STATE_STATE
+from homeassistant.const import UnitOfPower, UnitOfTemperature
 from homeassistant.helpers.entity_registry import RegistryEntry
 from homeassistant.helpers.device_registry import DeviceRegistry
 from homeassistant.helpers import entity_registry
 from homeassistant.helpers import device_registry
 from homeassistant.helpers import template
+from homeassistant.util import dt as dt_util
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+import asyncio
+import base64
+import gzip
 import json
+import numpy as np
 from .const import LOGGER
 from . import const
 
@@ -27,6 +37,71 @@ class OptisparkGetHistoryError(Exception):
     """Error getting heat pump history and user data."""
 
 
+# States that are expected from sensors that aren't reporting a number
+INVALID_STATES = ['', 'None', 'none', 'unknown', 'unavailable']
+# States of a sensor that isn't reporting, resampling intervals spent entirely in them are left out
+UNAVAILABLE_STATES = ['unknown', 'unavailable']
+CLIMATE_TEMPERATURE_ATTRIBUTES = [
+    'current_temperature', 'target_temp_high', 'target_temp_low', 'temperature']
+CLIMATE_STRING_ATTRIBUTES = ['hvac_action']
+# How the states of each column are resampled.  Power is averaged over time, temperatures take the
+# last value and the HVAC state takes the most common value.
+RESAMPLE_STATE_METHODS = {
+    const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY: 'mode',
+    const.DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER: 'mean',
+    const.DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE: 'last'}
+# Units that long-term statistics are converted to, keyed by unit class
+STATISTICS_UNITS = {
+    'power': UnitOfPower.KILO_WATT,
+    'temperature': UnitOfTemperature.CELSIUS}
+
+
+class HistoryQueryProfile(NamedTuple):
+    """Options passed to the recorder when querying the history of a column."""
+
+    significant_changes_only: bool
+    minimal_response: bool
+    no_attributes: bool
+    compressed_state_format: bool
+
+
+# Every attribute of every state change, as full State objects
+FULL_QUERY_PROFILE = HistoryQueryProfile(
+    significant_changes_only=False,
+    minimal_response=False,
+    no_attributes=False,
+    compressed_state_format=False)
+# Numeric sensors only need the state and the unit.  The unit is looked up once per query instead
+# of deserialising the attributes of every row.
+NUMERIC_QUERY_PROFILE = HistoryQueryProfile(
+    significant_changes_only=False,
+    minimal_response=True,
+    no_attributes=True,
+    compressed_state_format=True)
+
+QUERY_PROFILES = {
+    const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY: FULL_QUERY_PROFILE,
+    const.DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER: NUMERIC_QUERY_PROFILE,
+    const.DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE: NUMERIC_QUERY_PROFILE}
+
+
+class MinimalState(NamedTuple):
+    """Lightweight replacement for State, built from compressed recorder rows.
+
+    Only provides the parts of the State interface that are used when cleaning the history.
+    """
+
+    entity_id: str
+    state: str
+    last_updated_timestamp: float
+    attributes: dict
+
+    @property
+    def last_updated(self) -> datetime:
+        """Time of the state change as a UTC datetime."""
+        return dt_util.utc_from_timestamp(self.last_updated_timestamp)
+
+
 def to_celcius(x):
     """Convert from Farenheit to Celcius."""
     return (x-32) * 5/9
@@ -66,7 +141,152 @@ def get_user_info(hass, heat_pump_entity_id, postcode, tariff):
             'tariff': tariff}
 
 
-def climate_history(hass, state_changes):
+@dataclass
+class HistoryColumn:
+    """Cleaned history of a single database column, stored as parallel numpy arrays.
+
+    timestamps are seconds since the epoch (UTC), sorted and unique.
+    states are float64 for the sensors and the raw state strings for the climate entity.  Before
+    resampling, sensor states are NaN while the sensor was unknown or unavailable.
+    attributes holds additional per time step columns (only used by the climate entity).
+    """
+
+    entity_id: str
+    timestamps: np.ndarray
+    states: np.ndarray
+    attributes: dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __len__(self):
+        """Number of time steps."""
+        return len(self.timestamps)
+
+
+class DroppedReadings:
+    """Count readings removed while cleaning a column so that they can be logged once."""
+
+    def __init__(self, column_name, total):
+        """Init."""
+        self.column_name = column_name
+        self.total = total
+        self.reasons = {}
+
+    def add(self, reason, count):
+        """Record count readings dropped for reason."""
+        count = int(count)
+        if count:
+            self.reasons[reason] = self.reasons.get(reason, 0) + count
+
+    def log(self):
+        """Log a single summary of everything that has been dropped."""
+        if not self.reasons:
+            return
+        dropped = sum(self.reasons.values())
+        summary = ', '.join(f'{reason}: {count}' for reason, count in self.reasons.items())
+        LOGGER.warning(
+            f'({self.column_name}) dropped {dropped} of {self.total} readings ({summary})')
+
+
+def parse_floats(values):
+    """Convert a sequence of states/attributes to float64.
+
+    Values that can't be converted (None, '', 'unknown', 'unavailable', ...) become NaN.
+    """
+    strings = np.asarray(values, dtype=object).astype(str)
+    out = np.full(len(strings), np.nan)
+    valid = ~np.isin(strings, INVALID_STATES)
+    try:
+        out[valid] = strings[valid].astype(np.float64)
+    except ValueError:
+        # Something unexpected in there, fall back to converting one at a time
+        def to_float(value):
+            try:
+                return float(value)
+            except ValueError:
+                return np.nan
+        out[valid] = np.fromiter(
+            (to_float(value) for value in strings[valid]), np.float64, count=valid.sum())
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def get_timestamps(state_changes):
+    """last_updated of each state as seconds since the epoch."""
+    return np.fromiter(
+        (time_step.last_updated_timestamp for time_step in state_changes),
+        np.float64,
+        count=len(state_changes))
+
+
+def unique_timestamps_mask(timestamps):
+    """Mask that keeps the last reading of each timestamp.
+
+    timestamps must be sorted.
+    """
+    keep = np.ones(len(timestamps), dtype=bool)
+    keep[:-1] = timestamps[1:] != timestamps[:-1]
+    return keep
+
+
+def sort_by_timestamp(timestamps, *columns):
+    """Sort timestamps and columns by time, if not already sorted."""
+    if np.all(timestamps[1:] >= timestamps[:-1]):
+        return (timestamps, *columns)
+    order = np.argsort(timestamps, kind='stable')
+    return (timestamps[order], *[column[order] for column in columns])
+
+
+def sensor_column(column_name, state_changes, unit_conversions, unknown_unit_error):
+    """Clean the history of a numeric sensor.
+
+    unit_conversions maps the unit_of_measurement to a vectorised function that converts the
+    values to the unit used by the backend.  Readings in any other unit are dropped, unless
+    unknown_unit_error is set in which case a ValueError is raised.
+    """
+    dropped = DroppedReadings(column_name, len(state_changes))
+    timestamps = get_timestamps(state_changes)
+    raw_states = np.array([time_step.state for time_step in state_changes], dtype=object)
+    units = np.array(
+        [time_step.attributes.get('unit_of_measurement') for time_step in state_changes],
+        dtype=object)
+    timestamps, raw_states, units = sort_by_timestamp(timestamps, raw_states, units)
+
+    empty = raw_states == ''
+    dropped.add('no state value', empty.sum())
+    values = parse_floats(raw_states)
+    # Kept as NaN, they mark when the sensor stopped reporting
+    unavailable = np.isin(raw_states.astype(str), UNAVAILABLE_STATES)
+    invalid = np.isnan(values) & ~empty & ~unavailable
+    dropped.add('not a number', invalid.sum())
+    keep = ~(empty | invalid | unavailable)
+
+    converted = np.full(len(values), np.nan)
+    for unit in set(units[keep].tolist()):
+        if unit is None:
+            continue
+        if unit not in unit_conversions:
+            if unknown_unit_error:
+                LOGGER.error(f'({column_name}) sensor uses unkown units ({unit})')
+                raise ValueError(f'({column_name}) sensor uses unkown units ({unit})')
+            continue
+        unit_mask = keep & (units == unit)
+        converted[unit_mask] = unit_conversions[unit](values[unit_mask])
+    missing_unit = keep & (units == None)  # noqa: E711
+    dropped.add('unit_of_measurement missing', missing_unit.sum())
+    unsupported_unit = keep & ~missing_unit & np.isnan(converted)
+    dropped.add('unsupported unit', unsupported_unit.sum())
+    keep = (keep & ~np.isnan(converted)) | unavailable
+
+    timestamps = timestamps[keep]
+    converted = converted[keep]
+    unique = unique_timestamps_mask(timestamps)
+    dropped.add('duplicate timestamp', (~unique).sum())
+    dropped.log()
+
+    entity_id = state_changes[-1].entity_id if state_changes else None
+    return HistoryColumn(entity_id, timestamps[unique], converted[unique])
+
+
+def climate_columns(hass, state_changes):
     """Climate history.
 
     Home assistant logs the temperature states in whatever unit is set by the user (not the heat
@@ -75,45 +295,55 @@ def climate_history(hass, state_changes):
     If the user toggles the hh temperature units, the past logs will be messed up.  The units will be
     incorrect, they will have been stored as the old unit but now read as the new unit.  Lets just hope
     people don't regularly swap their temperature units.
+
+    Readings are never dropped because of their attributes, attributes that can't be converted to
+    float are set to NaN.
     """
-    history = {}
-    constant_attributes = {}  # Store attributes that would otherwise repeat in every time step
+    column_name = const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY
     hh_temp_units = hass.config.units.temperature_unit
-    attributes_to_convert_to_celcius = ['current_temperature', 'target_temp_high', 'target_temp_low', 'temperature']
-    for time_step in state_changes:
-        if hh_temp_units == UnitOfTemperature.FAHRENHEIT:
-            for key in attributes_to_convert_to_celcius:
-                if key in time_step.attributes:
-                    try:
-                        time_step.attributes[key] = to_celcius(float(time_step.attributes[key]))
-                    except Exception:
-                        LOGGER.warn(f'Could not convert time_step.attributes[{key}] ({time_step.attributes[key]}) of type({type(time_step.attributes[key])}) to float')
-                        continue
-        elif hh_temp_units == UnitOfTemperature.CELSIUS:
-            # Already in °C but still cast to float
-            for key in attributes_to_convert_to_celcius:
-                if key in time_step.attributes:
-                    try:
-                        time_step.attributes[key] = float(time_step.attributes[key])
-                    except Exception:
-                        LOGGER.warn(f'Could not convert time_step.attributes[{key}] ({time_step.attributes[key]}) of type({type(time_step.attributes[key])}) to float')
-                        continue
-        else:
-            LOGGER.error(f'Heat pump uses unkown units ({hh_temp_units})')
-            raise ValueError(f'Heat pump uses unkown units ({hh_temp_units})')
-
-        history[time_step.last_updated] = {
-            'state': time_step.state,
-            'attributes': time_step.attributes}
-
-    # Get attributes from most recent time_step
-    constant_attributes = {
-        'entity_id': state_changes[-1].entity_id,
-        'attributes': state_changes[-1].attributes}
+    if hh_temp_units == UnitOfTemperature.FAHRENHEIT:
+        convert = to_celcius
+    elif hh_temp_units == UnitOfTemperature.CELSIUS:
+        # Already in °C but still cast to float
+        def convert(x):
+            return x
+    else:
+        LOGGER.error(f'Heat pump uses unkown units ({hh_temp_units})')
+        raise ValueError(f'Heat pump uses unkown units ({hh_temp_units})')
+
+    dropped = DroppedReadings(column_name, len(state_changes))
+    timestamps = get_timestamps(state_changes)
+    states = np.array([time_step.state for time_step in state_changes], dtype=object)
+    attributes = {}
+    for key in CLIMATE_TEMPERATURE_ATTRIBUTES:
+        raw_values = np.array(
+            [time_step.attributes.get(key) for time_step in state_changes], dtype=object)
+        values = parse_floats(raw_values)
+        invalid = np.isnan(values) & (raw_values != None)  # noqa: E711
+        if invalid.any():
+            LOGGER.warning(
+                f'({column_name}) could not convert {invalid.sum()} values of attribute ({key}) to float')
+        attributes[key] = convert(values)
+    for key in CLIMATE_STRING_ATTRIBUTES:
+        attributes[key] = np.array(
+            [time_step.attributes.get(key) for time_step in state_changes], dtype=object)
+    timestamps, states, *attribute_values = sort_by_timestamp(
+        timestamps, states, *attributes.values())
+    attributes = dict(zip(attributes, attribute_values))
+
+    unique = unique_timestamps_mask(timestamps)
+    dropped.add('duplicate timestamp', (~unique).sum())
+    dropped.log()
+
+    entity_id = state_changes[-1].entity_id if state_changes else None
+    return HistoryColumn(
+        entity_id,
+        timestamps[unique],
+        states[unique],
+        {key: values[unique] for key, values in attributes.items()})
 
-    return history, constant_attributes
 
-def external_temp_history(_hass, state_changes):
+def external_temp_columns(_hass, state_changes):
     """External temperature history.
 
     The sensor will be displayed in whatever unit the sensor is set to. This is odd.  It ignores the
@@ -121,98 +351,78 @@ def external_temp_history(_hass, state_changes):
 
     The unit is stored with each time step log, so we are fully able convert the history to °C.
     """
-    history = {}
-    constant_attributes = {}  # Store attributes that would otherwise repeat in every time step
-    for time_step in state_changes:
-        if time_step.state == '':
-            LOGGER.warn(f'time_step ({time_step}) has no state value')
-            continue
-        if 'unit_of_measurement' not in time_step.attributes:
-            LOGGER.warn(f'unit_of_measurement missing from time_step ({time_step})')
-            continue
-        unit = time_step.attributes['unit_of_measurement']
-        state = time_step.state
-        if unit == '°F':
-            try:
-                state = to_celcius(float(time_step.state))
-            except Exception:
-                LOGGER.warn(f'Could not convert state ({time_step.state}) of type({type(time_step.state)}) to float')
-                continue
-        elif unit == '°C':
-            try:
-                state = float(time_step.state)
-            except Exception:
-                LOGGER.warn(f'Could not convert state ({time_step.state}) of type({type(time_step.state)}) to float')
-                continue
-        else:
-            LOGGER.error(f'External temperature sensor uses unkown units ({unit})')
-            raise ValueError(f'External temperature sensor uses unkown units ({unit})')
-        history[time_step.last_updated] = {
-            'state': state,
-            'attributes': {}}
+    return sensor_column(
+        const.DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE,
+        state_changes,
+        unit_conversions={
+            UnitOfTemperature.CELSIUS: lambda x: x,
+            UnitOfTemperature.FAHRENHEIT: to_celcius},
+        unknown_unit_error=True)
 
-    # Get attributes from most recent time_step
-    constant_attributes = {
-        'entity_id': state_changes[-1].entity_id,
-        'attributes': state_changes[-1].attributes}
-
-    return history, constant_attributes
 
-
-def power_history(_hass, state_changes):
+def power_columns(_hass, state_changes):
     """Heat pump power use history.
 
     Home assistant includes units in each power usage log.  There are no issues converting
     each time step to kW.  The unit recorded is that used by the sensor.
     """
-    history = {}
-    constant_attributes = {}  # Store attributes that would otherwise repeat in every time step
-    for time_step in state_changes:
-        if time_step.state == '':
-            LOGGER.warn(f'time_step ({time_step}) has no state value')
-            continue
-        if 'unit_of_measurement' not in time_step.attributes:
-            LOGGER.warn(f'unit_of_measurement missing from time_step ({time_step})')
-            continue
-        unit = time_step.attributes['unit_of_measurement']
-        state = time_step.state
-        if unit == 'W':
-            try:
-                state = float(state) / 1000
-            except Exception:
-                LOGGER.warn(f'Could not convert state ({state}) of type({type(state)}) to float')
-                continue
-        elif unit == 'kW':
-            try:
-                state = float(state)
-            except Exception:
-                LOGGER.warn(f'Could not convert state ({state}) of type({type(state)}) to float')
-                continue
-        else:
-            LOGGER.warn(f'Heat pump uses unsupported units ({unit})')
-            continue
-        history[time_step.last_updated] = {
-            'state': state,
-            'attributes': {}}
+    return sensor_column(
+        const.DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER,
+        state_changes,
+        unit_conversions={
+            UnitOfPower.WATT: lambda x: x / 1000,
+            UnitOfPower.KILO_WATT: lambda x: x},
+        unknown_unit_error=False)
 
-    # Get attributes from most recent time_step
-    constant_attributes = {
-        'entity_id': state_changes[-1].entity_id,
-        'attributes': state_changes[-1].attributes}
 
-    return history, constant_attributes
+async def get_unit_of_measurement(hass, entity_id):
+    """Unit of measurement of entity_id.
 
+    Taken from the current state if possible, otherwise from the most recently recorded state.
+    Returns None if no unit could be found.
+    """
+    state = hass.states.get(entity_id)
+    if state is not None and 'unit_of_measurement' in state.attributes:
+        return state.attributes['unit_of_measurement']
+    last_state_changes = await get_instance(hass).async_add_executor_job(
+        get_last_state_changes,
+        hass,
+        1,
+        entity_id)
+    for last_state in last_state_changes.get(entity_id, []):
+        if 'unit_of_measurement' in last_state.attributes:
+            return last_state.attributes['unit_of_measurement']
+    return None
+
+
+def compressed_states_to_minimal_states(entity_id, compressed_states, attributes):
+    """Convert compressed recorder rows to MinimalState.
 
-async def get_state_changes(hass, entity_id, history_days):
-    """History of state changes for entity_id."""
+    All rows share the same attributes dict, attributes are not stored per row.
+    """
+    return [
+        MinimalState(
+            entity_id,
+            compressed_state[COMPRESSED_STATE_STATE],
+            compressed_state[COMPRESSED_STATE_LAST_UPDATED],
+            attributes)
+        for compressed_state in compressed_states]
+
+
+async def get_state_changes(
+        hass, entity_id, history_days, query_profile=FULL_QUERY_PROFILE,
+        include_start_time_state=False, end_time=None):
+    """History of state changes for entity_id.
+
+    If query_profile uses the compressed state format, MinimalState rows are returned instead of
+    State objects.  Their attributes only contain the unit_of_measurement.
+    include_start_time_state adds the state that was held at the start of the period.
+    The period starts history_days ago and ends at end_time, now if not given.
+    """
     start_time = datetime.now(tz=timezone.utc) - timedelta(days=history_days)
-    end_time = datetime.now(tz=timezone.utc)
+    if end_time is None:
+        end_time = datetime.now(tz=timezone.utc)
     filters = None
-    include_start_time_state = False
-    significant_changes_only = False
-    minimal_response = False
-    no_attributes = False
-    compressed_state_format = False
     args = [
         hass,
         start_time,
@@ -220,15 +430,45 @@ async def get_state_changes(hass, entity_id, history_days):
         [entity_id],
         filters,
         include_start_time_state,
-        significant_changes_only,
-        minimal_response,
-        no_attributes,
-        compressed_state_format]
+        query_profile.significant_changes_only,
+        query_profile.minimal_response,
+        query_profile.no_attributes,
+        query_profile.compressed_state_format]
     state_changes = await get_instance(hass).async_add_executor_job(
         get_significant_states,
         *args)
 
-    return state_changes[entity_id]
+    # Entities without any state changes in the period are missing
+    state_changes = state_changes.get(entity_id, [])
+    if not query_profile.compressed_state_format:
+        return state_changes
+    attributes = {}
+    if (unit := await get_unit_of_measurement(hass, entity_id)) is not None:
+        attributes['unit_of_measurement'] = unit
+    return compressed_states_to_minimal_states(entity_id, state_changes, attributes)
+
+
+async def get_entities_state_changes(
+        hass, entity_columns, history_days, query_profile=None, include_start_time_state=False):
+    """History of state changes for several entities.
+
+    entity_columns maps entity_id to column name.  Each entity is queried using the
+    QUERY_PROFILES entry of its column, unless query_profile is given.
+    include_start_time_state is passed on to get_state_changes.
+    The recorder queries are run concurrently so the total time is roughly that of the slowest
+    entity.  Entity ids that are None (optional entities not enabled) are skipped.
+    Returns {entity_id: state_changes}.
+    """
+    entity_ids = [entity_id for entity_id in entity_columns if entity_id is not None]
+    all_state_changes = await asyncio.gather(*[
+        get_state_changes(
+            hass,
+            entity_id,
+            history_days,
+            query_profile or QUERY_PROFILES[entity_columns[entity_id]],
+            include_start_time_state)
+        for entity_id in entity_ids])
+    return dict(zip(entity_ids, all_state_changes))
 
 
 async def get_state_changes_period(hass, entity_id, history_days):
@@ -256,28 +496,319 @@ async def get_state_changes_period(hass, entity_id, history_days):
     return state_changes[entity_id]
 
 
-def states_to_histories(hass, column_name, state_changes):
+def get_raw_history_days(hass):
+    """Days of raw states kept by the recorder, capped at const.DYNAMO_HISTORY_DAYS.
+
+    Older raw states have been purged, only the long-term statistics go further back.
+    """
+    return min(get_instance(hass).keep_days, const.DYNAMO_HISTORY_DAYS)
+
+
+async def get_statistics_column(hass, entity_id, end_time):
+    """Mean of entity_id in each long-term statistics period before end_time.
+
+    Covers const.DYNAMO_HISTORY_DAYS.  Only periods that finish before end_time are included, so
+    they never overlap readings that have already been uploaded.  The recorder converts the
+    values to kW and °C.  Timestamps are the start of each period.
+    Returns a HistoryColumn and the constant attributes, in the same format as states_to_columns.
+    """
+    start_time = datetime.now(tz=timezone.utc) - timedelta(days=const.DYNAMO_HISTORY_DAYS)
+    statistics = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        start_time,
+        end_time,
+        {entity_id},
+        const.HISTORY_STATISTICS_PERIOD,
+        STATISTICS_UNITS,
+        {'mean'})
+    rows = statistics.get(entity_id, [])
+    timestamps = np.array([row['start'] for row in rows], dtype=np.float64)
+    ends = np.array([row['end'] for row in rows], dtype=np.float64)
+    states = np.array(
+        [row['mean'] if row.get('mean') is not None else np.nan for row in rows],
+        dtype=np.float64)
+    keep = (ends <= end_time.timestamp()) & ~np.isnan(states)
+
+    constant_attributes = {'entity_id': entity_id, 'attributes': {}}
+    if (unit := await get_unit_of_measurement(hass, entity_id)) is not None:
+        constant_attributes['attributes']['unit_of_measurement'] = unit
+    return HistoryColumn(entity_id, timestamps[keep], states[keep]), constant_attributes
+
+
+def resample_edges(timestamps, resolution, end=None):
+    """Edges of the resolution second intervals that cover timestamps.
+
+    If end is given the intervals continue up to it, the last reading is held until then.
+    """
+    start = np.floor(timestamps[0] / resolution) * resolution
+    last = (np.floor(timestamps[-1] / resolution) + 1) * resolution
+    if end is not None:
+        last = max(last, np.ceil(end / resolution) * resolution)
+    return np.arange(start, last + resolution / 2, resolution)
+
+
+def resample_last(timestamps, values, edges):
+    """Last value before the end of each interval.
+
+    Intervals without a reading hold the value of the previous reading.
+    """
+    idx = np.searchsorted(timestamps, edges[1:], side='left') - 1
+    return values[idx]
+
+
+def resample_time_weighted_mean(timestamps, values, edges):
+    """Mean of each interval, weighting each reading by how long it was held for.
+
+    Each reading holds until the next one, the last reading holds until the end of the last
+    interval.  NaN readings (the sensor was unavailable) are left out of the mean, intervals
+    without any time holding a number are NaN.
+    """
+    held_until = np.append(timestamps[1:], max(edges[-1], timestamps[-1]))
+    held_for = held_until - timestamps
+    available = ~np.isnan(values)
+    filled = np.where(available, values, 0.0)
+    # Integrals from the first reading up to each reading
+    value_integral = np.concatenate([[0.0], np.cumsum(filled * held_for)])
+    available_integral = np.concatenate([[0.0], np.cumsum(available * held_for)])
+
+    def integral(cumulative, rates, x):
+        idx = np.searchsorted(timestamps, x, side='right') - 1
+        return cumulative[idx] + rates[idx] * (x - timestamps[idx])
+
+    lower = np.clip(edges[:-1], timestamps[0], held_until[-1])
+    upper = np.clip(edges[1:], timestamps[0], held_until[-1])
+    available_for = (
+        integral(available_integral, available, upper)
+        - integral(available_integral, available, lower))
+    mean = (
+        (integral(value_integral, filled, upper) - integral(value_integral, filled, lower))
+        / np.where(available_for > 0, available_for, 1))
+    return np.where(available_for > 0, mean, np.nan)
+
+
+def resample_mode(timestamps, values, edges):
+    """Most common value of each interval.
+
+    Intervals without a reading hold the value of the previous reading.
+    """
+    strings = np.where(values == None, '', values).astype(str)  # noqa: E711
+    categories, codes = np.unique(strings, return_inverse=True)
+    bins = np.searchsorted(edges, timestamps, side='right') - 1
+    counts = np.bincount(
+        bins * len(categories) + codes,
+        minlength=(len(edges) - 1) * len(categories)).reshape(len(edges) - 1, len(categories))
+    mode = np.where(
+        counts.any(axis=1),
+        counts.argmax(axis=1),
+        resample_last(timestamps, codes, edges))
+    return np.array(
+        [category if category != '' else None for category in categories.tolist()],
+        dtype=object)[mode]
+
+
+RESAMPLE_METHODS = {
+    'mean': resample_time_weighted_mean,
+    'last': resample_last,
+    'mode': resample_mode,
+}
+
+
+def resample_column(column_name, column: HistoryColumn, resolution, start=None, end=None):
+    """Resample column to one value every resolution seconds.
+
+    The states are resampled with the method set for the column in RESAMPLE_STATE_METHODS.
+    Climate attributes use the last value for numbers and the mode for strings.
+    Timestamps are the start of each interval.  The recorder only stores changes, so a reading
+    holds through the following intervals until the next one, up to end if given.  Intervals
+    before start, and those spent entirely unknown or unavailable, are left out.
+    """
+    if len(column) == 0:
+        return column
+    if column.states.dtype == object:
+        available = ~np.isin(column.states.astype(str), UNAVAILABLE_STATES)
+    else:
+        available = ~np.isnan(column.states)
+    if not available.any():
+        return HistoryColumn(
+            column.entity_id, column.timestamps[:0], column.states[:0],
+            {key: values[:0] for key, values in column.attributes.items()})
+    edges = resample_edges(column.timestamps, resolution, end)
+    has_readings = resample_time_weighted_mean(
+        column.timestamps, available.astype(np.float64), edges) > 0
+    if start is not None:
+        has_readings &= edges[:-1] >= start
+    # Only the readings taken while available are resampled, so an interval holds the last real
+    # value rather than the unavailable reading that may follow it.  The time weighted mean skips
+    # NaN readings itself and needs them to know when each value stopped being held.
+    timestamps = column.timestamps[available]
+    method = RESAMPLE_STATE_METHODS[column_name]
+    if method == 'mean':
+        states = resample_time_weighted_mean(column.timestamps, column.states, edges)
+    else:
+        states = RESAMPLE_METHODS[method](timestamps, column.states[available], edges)
+    attributes = {
+        key: (resample_mode if values.dtype == object else resample_last)(
+            timestamps, values[available], edges)
+        for key, values in column.attributes.items()}
+    return HistoryColumn(
+        column.entity_id,
+        edges[:-1][has_readings],
+        states[has_readings],
+        {key: values[has_readings] for key, values in attributes.items()})
+
+
+def resample_chunk_end(column_name, state_changes, end):
+    """Move the end of a chunk of state_changes so it doesn't split a resampling interval.
+
+    Returns the index that the chunk should end at (exclusive).
+    """
+    resolution = const.HISTORY_RESAMPLE_SECONDS.get(column_name)
+    if resolution is None or end <= 0 or end >= len(state_changes):
+        return end
+    interval_end = (state_changes[end - 1].last_updated_timestamp // resolution + 1) * resolution
+    while end < len(state_changes) and state_changes[end].last_updated_timestamp < interval_end:
+        end += 1
+    return end
+
+
+def resample_chunk_start(column_name, state_changes, start):
+    """Move the start of a chunk of state_changes so it doesn't split a resampling interval.
+
+    The start is moved later, to the first reading of the next interval.  If the chunk is all in
+    one interval it is moved earlier instead, to the first reading of that interval.
+    Returns the index that the chunk should start at.
+    """
+    resolution = const.HISTORY_RESAMPLE_SECONDS.get(column_name)
+    if resolution is None or start <= 0 or start >= len(state_changes):
+        return max(start, 0)
+    interval_start = state_changes[start].last_updated_timestamp // resolution * resolution
+    if state_changes[start - 1].last_updated_timestamp < interval_start:
+        return start
+    later = start
+    while (
+            later < len(state_changes)
+            and state_changes[later].last_updated_timestamp < interval_start + resolution):
+        later += 1
+    if later < len(state_changes):
+        return later
+    while start > 0 and state_changes[start - 1].last_updated_timestamp >= interval_start:
+        start -= 1
+    return start
+
+
+def states_to_columns(hass, column_name, state_changes, start=None, end=None):
     """Clean up history states.
 
     Extracts relevent information from the states and ensures that everything is in the right data
-    type.
+    type.  The column is resampled if const.HISTORY_RESAMPLE_SECONDS sets a resolution for it,
+    start and end limit the intervals as in resample_column.
+    Returns a HistoryColumn and the attributes of the most recent state.
     """
     function_lookup = {
-        const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY: climate_history,
-        const.DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER: power_history,
-        const.DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE: external_temp_history}
-    histories, constant_attributes = function_lookup[column_name](
-        hass,
-        state_changes)
-    return histories, constant_attributes
+        const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY: climate_columns,
+        const.DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER: power_columns,
+        const.DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE: external_temp_columns}
+    column = function_lookup[column_name](hass, state_changes)
+    if (resolution := const.HISTORY_RESAMPLE_SECONDS.get(column_name)) is not None:
+        column = resample_column(column_name, column, resolution, start, end)
+    elif column.states.dtype != object:
+        # Unavailable readings only mark the gaps for resampling
+        keep = ~np.isnan(column.states)
+        column = HistoryColumn(column.entity_id, column.timestamps[keep], column.states[keep])
+
+    # Get attributes from most recent time_step
+    constant_attributes = {}  # Store attributes that would otherwise repeat in every time step
+    if state_changes:
+        constant_attributes = {
+            'entity_id': state_changes[-1].entity_id,
+            'attributes': dict(state_changes[-1].attributes)}
+    return column, constant_attributes
+
+
+def encode_array(values, dtype):
+    """Encode a numpy array as base64 of its little endian bytes."""
+    dtype = np.dtype(dtype).newbyteorder('<')
+    return {
+        'dtype': dtype.str,
+        'data': base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode('ascii')}
+
+
+def encode_strings(values):
+    """Encode an array of strings as a list of categories and an array of category codes.
+
+    Missing values (None) and empty strings are both given the category None.
+    """
+    strings = np.where(values == None, '', values).astype(str)  # noqa: E711
+    categories, codes = np.unique(strings, return_inverse=True)
+    return {
+        'categories': [category if category != '' else None for category in categories.tolist()],
+        'codes': encode_array(codes, np.min_scalar_type(max(len(categories) - 1, 0)))}
+
+
+def encode_values(values):
+    """Encode a column of values, float32 for numbers and categories for strings."""
+    if values.dtype == object:
+        return encode_strings(values)
+    return encode_array(values, np.float32)
 
 
-def histories_to_dynamo_data(hass, histories, constant_attributes, user_hash, heat_pump_entity_id,
-                             postcode, tariff):
-    """Package the history data so that it's ready for upload to lambda."""
-    user_info = get_user_info(hass, heat_pump_entity_id, postcode, tariff)
+def column_to_payload(column: HistoryColumn):
+    """Compact columnar representation of a HistoryColumn for upload.
+
+    Timestamps are sent in milliseconds as the first timestamp followed by the delta between each
+    consecutive timestamp, using the smallest unsigned integer type that fits.  Values are sent as
+    float32 and climate attributes are sent as parallel columns.
+    """
+    timestamps = np.round(column.timestamps * 1000).astype(np.int64)
+    deltas = np.diff(timestamps)
+    delta_dtype = np.min_scalar_type(int(deltas.max())) if len(deltas) else np.uint8
+    return {
+        'entity_id': column.entity_id,
+        'length': len(column),
+        'timestamp_start': int(timestamps[0]) if len(timestamps) else None,
+        'timestamp_deltas': encode_array(deltas, delta_dtype),
+        'states': encode_values(column.states),
+        'attributes': {key: encode_values(values) for key, values in column.attributes.items()}}
+
+
+def encode_payload_body(payload, encoding=const.HISTORY_PAYLOAD_ENCODING):
+    """Serialise payload to JSON and optionally compress it.
+
+    encoding is one of None, 'gzip' or 'zstd'.  zstd is only used if the zstandard package is
+    installed, otherwise gzip is used.
+    Returns the body and the matching Content-Encoding (None if uncompressed).
+    """
+    body = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+    if encoding == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            LOGGER.debug('zstandard not installed, compressing history payload with gzip')
+            encoding = 'gzip'
+        else:
+            return zstandard.ZstdCompressor().compress(body), 'zstd'
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6), 'gzip'
+    if encoding is not None:
+        raise ValueError(f'Unsupported history payload encoding ({encoding})')
+    return body, None
+
+
+def histories_to_dynamo_data(hass, columns, constant_attributes, user_hash, heat_pump_entity_id,
+                             postcode, tariff, user_info=None):
+    """Package the history data so that it's ready for upload to lambda.
+
+    columns is {column_name: HistoryColumn}, each column is converted to the compact columnar
+    format.
+    user_info must be given when called from outside the event loop, as it uses the registries.
+    """
+    if user_info is None:
+        user_info = get_user_info(hass, heat_pump_entity_id, postcode, tariff)
     dynamo_data = {
-        'histories': histories,
+        'format': const.HISTORY_PAYLOAD_FORMAT,
+        'histories': {
+            column_name: column_to_payload(column) for column_name, column in columns.items()},
         'constant_attributes': constant_attributes,
         'user_info': user_info,
         'user_hash': user_hash}
@@ -299,33 +830,30 @@ async def get_history(hass, history_days: int, climate_entity_id, heat_pump_powe
         heat_pump_power_entity_id: const.DATABASE_COLUMN_SENSOR_HEAT_PUMP_POWER,
         external_temp_entity_id: const.DATABASE_COLUMN_SENSOR_EXTERNAL_TEMPERATURE,
         climate_entity_id: const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY}
-    function_lookup = {
-        climate_entity_id: climate_history,
-        external_temp_entity_id: external_temp_history,
-        heat_pump_power_entity_id: power_history}
 
-    for entity_id in function_lookup:
+    for entity_id in column_name_lookup:
         if entity_id is None:
             LOGGER.debug(f'({column_name_lookup[entity_id]}) entity missing, skipping...')
-            continue
+    entities_state_changes = await get_entities_state_changes(hass, column_name_lookup, history_days)
+    for entity_id, state_changes in entities_state_changes.items():
         column_name = column_name_lookup[entity_id]
-        state_changes = await get_state_changes(hass, entity_id, history_days)
-        histories[column_name], constant_attributes[column_name] = states_to_histories(
+        histories[column_name], constant_attributes[column_name] = states_to_columns(
             hass,
             column_name,
             state_changes)
 
-
     dynamo_data = histories_to_dynamo_data(hass, histories, constant_attributes, user_hash,
                                            heat_pump_power_entity_id, postcode, tariff)
     return dynamo_data
 
 
 async def get_earliest_and_latest_data_dates(hass, climate_entity_id, heat_pump_power_entity_id,
-                                             external_temp_entity_id):
+                                             external_temp_entity_id,
+                                             history_days=const.DYNAMO_HISTORY_DAYS):
     """For each entity id find the earliest date that data has been recorded and the latest date.
 
-    Does not check further back than const.DYNAMO_HISTORY_DAYS (5 years).
+    Does not check further back than history_days (const.DYNAMO_HISTORY_DAYS by default).
+    Entities without any history in that period are left out.
     """
     entity_id_to_column_name = {
         climate_entity_id: const.DATABASE_COLUMN_SENSOR_CLIMATE_ENTITY,
@@ -337,8 +865,12 @@ async def get_earliest_and_latest_data_dates(hass, climate_entity_id, heat_pump_
     for entity_id in entity_id_to_column_name:
         if entity_id is None:
             LOGGER.debug(f'({entity_id_to_column_name[entity_id]}) entity missing, skipping...')
+    # Only the timestamps are needed
+    entities_state_changes = await get_entities_state_changes(
+        hass, entity_id_to_column_name, history_days, NUMERIC_QUERY_PROFILE)
+    for entity_id, state_changes in entities_state_changes.items():
+        if not state_changes:
             continue
-        state_changes = await get_state_changes(hass, entity_id, const.DYNAMO_HISTORY_DAYS)
         earliest_dates[entity_id_to_column_name[entity_id]] = state_changes[0].last_updated
         latest_dates[entity_id_to_column_name[entity_id]] = state_changes[-1].last_updated
     return earliest_dates, latest_dates
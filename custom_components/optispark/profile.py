@@ -0,0 +1,134 @@
+"""Heating profile returned by the backend, indexed by time.
+
+The profile is indexed once when it is fetched, so looking up the values for the current time is a
+binary search rather than rebuilding dictionaries on every update.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from homeassistant.util import dt as dt_util
+import numpy as np
+
+from . import const
+
+# Values that change over the course of the profile
+TIME_BASED_KEYS = [
+    const.LAMBDA_BASE_DEMAND,
+    const.LAMBDA_PRICE,
+    const.LAMBDA_TEMP_CONTROLS,
+    const.LAMBDA_OPTIMISED_DEMAND,
+]
+# Values that are interpolated linearly between time steps, the others are held until the next step
+INTERPOLATED_KEYS = [
+    const.LAMBDA_TEMP_CONTROLS,
+]
+# Values that apply to the whole profile
+NON_TIME_BASED_KEYS = [
+    const.LAMBDA_BASE_COST,
+    const.LAMBDA_OPTIMISED_COST,
+    const.LAMBDA_PROJECTED_PERCENT_SAVINGS,
+]
+
+
+class ProfileIndex:
+    """Heating profile with its time steps sorted for lookups."""
+
+    def __init__(self, lambda_results: dict) -> None:
+        """Init."""
+        self.lambda_results = lambda_results
+        timestamps = lambda_results[const.LAMBDA_TIMESTAMP]
+        order = np.argsort([timestamp.timestamp() for timestamp in timestamps], kind="stable")
+        self._order = order
+        self.times = [timestamps[idx] for idx in order]
+        self.timestamps = np.array([time.timestamp() for time in self.times])
+        self.values = {
+            key: [lambda_results[key][idx] for idx in order] for key in TIME_BASED_KEYS
+        }
+        self.constants = {key: lambda_results[key] for key in NON_TIME_BASED_KEYS}
+        # {(key, first time step): forecast}, filled as the forecasts are requested
+        self._forecasts = {}
+        # The backend will currently only update upon a new day. FIX!
+        self.expire_time = self.times[-1] + timedelta(seconds=const.PROFILE_EXPIRY_MARGIN)
+
+    def to_json(self) -> dict:
+        """The lambda results of the profile in a JSON serialisable format."""
+        return {
+            **self.lambda_results,
+            const.LAMBDA_TIMESTAMP: [
+                timestamp.isoformat() for timestamp in self.lambda_results[const.LAMBDA_TIMESTAMP]
+            ],
+        }
+
+    @classmethod
+    def from_json(cls, json: dict) -> ProfileIndex:
+        """Profile saved by to_json."""
+        return cls({
+            **json,
+            const.LAMBDA_TIMESTAMP: [
+                dt_util.parse_datetime(timestamp) for timestamp in json[const.LAMBDA_TIMESTAMP]
+            ],
+        })
+
+    def series(self, key: str) -> np.ndarray:
+        """Values of key for every time step as float64, in time order.
+
+        Missing keys and values that are None are NaN.
+        """
+        values = self.lambda_results.get(key)
+        if values is None or len(values) != len(self.timestamps):
+            return np.full(len(self.timestamps), np.nan)
+        return np.array(
+            [np.nan if values[idx] is None else values[idx] for idx in self._order],
+            dtype=np.float64,
+        )
+
+    def step_index(self, now: datetime) -> int:
+        """Index of the most recent time step before now, -1 if there is none."""
+        return int(np.searchsorted(self.timestamps, now.timestamp(), side="left")) - 1
+
+    def forecast(self, key: str, now: datetime) -> list[dict]:
+        """Values of key from the current time step to the end of the profile.
+
+        Each item is {"datetime": isoformat, "value": value}.  The forecast is built the first
+        time it is requested and reused until the profile moves to its next time step, so the same
+        list is returned on every update in between.
+        """
+        start = max(self.step_index(now), 0)
+        cache_key = (key, start)
+        if cache_key not in self._forecasts:
+            # Only the forecast for the current time step is kept
+            for old_key in [old_key for old_key in self._forecasts if old_key[0] == key]:
+                del self._forecasts[old_key]
+            self._forecasts[cache_key] = [
+                {"datetime": time.isoformat(), "value": value}
+                for time, value in zip(self.times[start:], self.values[key][start:])
+            ]
+        return self._forecasts[cache_key]
+
+    def starts_before(self, now: datetime) -> bool:
+        """Whether the profile has a time step before now."""
+        return len(self.timestamps) > 0 and self.timestamps[0] < now.timestamp()
+
+    def lookup(self, now: datetime, interpolate: bool = False) -> dict:
+        """Values of the most recent time step before now.
+
+        If interpolate is set, INTERPOLATED_KEYS are interpolated linearly between that time step
+        and the next one.
+        Raises ValueError if every time step is at or after now.
+        """
+        timestamp = now.timestamp()
+        idx = self.step_index(now)
+        if idx < 0:
+            raise ValueError(f"Heating profile starts after {now}")
+        out = {key: values[idx] for key, values in self.values.items()}
+        if interpolate and idx + 1 < len(self.timestamps):
+            fraction = (timestamp - self.timestamps[idx]) / (
+                self.timestamps[idx + 1] - self.timestamps[idx]
+            )
+            for key in INTERPOLATED_KEYS:
+                start, end = self.values[key][idx], self.values[key][idx + 1]
+                if start is not None and end is not None:
+                    out[key] = start + (end - start) * float(fraction)
+        out.update(self.constants)
+        return out
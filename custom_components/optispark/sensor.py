@@ -1,13 +1,29 @@
 """Sensor platform for optispark."""
 from __future__ import annotations
 
-from homeassistant.components.sensor import SensorEntity, SensorEntityDescription, SensorStateClass
+from datetime import timedelta
+
+from homeassistant.components.sensor import (
+    RestoreSensor,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
 from homeassistant.components.sensor.const import SensorDeviceClass
+from homeassistant.core import callback
+from homeassistant.util import dt as dt_util
 
 from . import const
+from .const import LOGGER
 from .coordinator import OptisparkDataUpdateCoordinator
 from .entity import OptisparkEntity
-#from .const import LOGGER
+
+# Reset periods of the accumulator sensors, with the name suffix used for each
+ACCUMULATOR_PERIODS = {
+    "day": "Today",
+    "week": "This Week",
+    "month": "This Month",
+}
 
 
 async def async_setup_entry(hass, entry, async_add_devices):
@@ -21,6 +37,7 @@ async def async_setup_entry(hass, entry, async_add_devices):
                 name="Base Demand",
                 icon="mdi:heat-pump-outline"),
             lambda_measurement=const.LAMBDA_BASE_DEMAND,
+            forecast=True,
             device_class=SensorDeviceClass.POWER,
             native_unit_of_measurement='kW',
             suggested_display_precision=2
@@ -32,6 +49,7 @@ async def async_setup_entry(hass, entry, async_add_devices):
                 name="Optimised Demand",
                 icon="mdi:heat-pump"),
             lambda_measurement=const.LAMBDA_OPTIMISED_DEMAND,
+            forecast=True,
             device_class=SensorDeviceClass.POWER,
             native_unit_of_measurement='kW',
             suggested_display_precision=2
@@ -43,6 +61,7 @@ async def async_setup_entry(hass, entry, async_add_devices):
                 name="Electricity Price",
                 icon="mdi:currency-gbp"),
             lambda_measurement=const.LAMBDA_PRICE,
+            forecast=True,
             device_class=SensorDeviceClass.MONETARY,
             native_unit_of_measurement='p/kWh',
             suggested_display_precision=1
@@ -54,6 +73,7 @@ async def async_setup_entry(hass, entry, async_add_devices):
                 name="Target House Temp",
                 icon="mdi:home-thermometer"),
             lambda_measurement=const.LAMBDA_TEMP_CONTROLS,
+            forecast=True,
             device_class=SensorDeviceClass.TEMPERATURE,
             native_unit_of_measurement='°C',
             suggested_display_precision=1
@@ -105,12 +125,87 @@ async def async_setup_entry(hass, entry, async_add_devices):
             suggested_display_precision=1,
             device_class=SensorDeviceClass.TEMPERATURE,
         ),
-    ])
+    ] + accumulator_sensors(coordinator))
+
+
+def realised_energy_rate(coordinator):
+    """Heat pump power usage in kW."""
+    return coordinator.heat_pump_power_usage
+
+
+def realised_cost_rate(coordinator):
+    """Cost of the heat pump power usage in p/h."""
+    return coordinator.heat_pump_power_usage * coordinator.data[const.LAMBDA_PRICE]
+
+
+def realised_savings_rate(coordinator):
+    """Saving of the heat pump power usage against the base demand in p/h."""
+    return (
+        coordinator.data[const.LAMBDA_BASE_DEMAND] - coordinator.heat_pump_power_usage
+    ) * coordinator.data[const.LAMBDA_PRICE]
+
+
+def accumulator_sensors(coordinator):
+    """Realised energy, cost and savings sensors for each of ACCUMULATOR_PERIODS."""
+    sensors = []
+    for period, period_name in ACCUMULATOR_PERIODS.items():
+        sensors += [
+            OptisparkAccumulatorSensor(
+                coordinator=coordinator,
+                entity_description=SensorEntityDescription(
+                    key=f"realised_energy_{period}",
+                    name=f"Heat Pump Energy {period_name}",
+                    icon="mdi:lightning-bolt"),
+                rate=realised_energy_rate,
+                period=period,
+                device_class=SensorDeviceClass.ENERGY,
+                native_unit_of_measurement='kWh',
+                suggested_display_precision=2,
+            ),
+            OptisparkAccumulatorSensor(
+                coordinator=coordinator,
+                entity_description=SensorEntityDescription(
+                    key=f"realised_cost_{period}",
+                    name=f"Heat Pump Cost {period_name}",
+                    icon="mdi:currency-gbp"),
+                rate=realised_cost_rate,
+                period=period,
+                device_class=SensorDeviceClass.MONETARY,
+                native_unit_of_measurement='p',
+                suggested_display_precision=1,
+            ),
+            OptisparkAccumulatorSensor(
+                coordinator=coordinator,
+                entity_description=SensorEntityDescription(
+                    key=f"realised_savings_{period}",
+                    name=f"Realised Savings {period_name}",
+                    icon="mdi:piggy-bank"),
+                rate=realised_savings_rate,
+                period=period,
+                device_class=SensorDeviceClass.MONETARY,
+                native_unit_of_measurement='p',
+                suggested_display_precision=1,
+            ),
+        ]
+    return sensors
+
+
+def period_start(now, period):
+    """Start of the day, week (Monday) or month that the local time now is in."""
+    start = dt_util.start_of_local_day(now)
+    if period == "week":
+        start -= timedelta(days=start.weekday())
+    elif period == "month":
+        start = start.replace(day=1)
+    return start
 
 
 class OptisparkSensor(OptisparkEntity, SensorEntity):
     """optispark Sensor class."""
 
+    # The forecast changes with every profile, there is no need to keep it in the history
+    _unrecorded_attributes = frozenset({"forecast"})
+
     def __init__(
         self,
         coordinator: OptisparkDataUpdateCoordinator,
@@ -120,9 +215,14 @@ class OptisparkSensor(OptisparkEntity, SensorEntity):
         device_class: str = None,
         native_unit_of_measurement: str = None,
         suggested_display_precision: int = None,
-        state_class: SensorStateClass = SensorStateClass.MEASUREMENT
+        state_class: SensorStateClass = SensorStateClass.MEASUREMENT,
+        forecast: bool = False,
     ) -> None:
-        """Initialize the sensor class."""
+        """Initialize the sensor class.
+
+        If forecast is set, the upcoming values of lambda_measurement from the heating profile are
+        added as the forecast attribute.
+        """
         super().__init__(coordinator)
         self.entity_description = entity_description
         self._lambda_measurement = lambda_measurement
@@ -131,6 +231,7 @@ class OptisparkSensor(OptisparkEntity, SensorEntity):
         self._native_unit_of_measurement = native_unit_of_measurement
         self._suggested_display_precision = suggested_display_precision
         self._state_class = state_class
+        self._forecast = forecast
 
     @property
     def suggested_display_precision(self):
@@ -163,6 +264,24 @@ class OptisparkSensor(OptisparkEntity, SensorEntity):
         else:
             return None
 
+    def _state_signature(self):
+        """Value rounded to suggested_display_precision, smaller changes aren't written."""
+        value = self.native_value
+        if isinstance(value, float) and self.suggested_display_precision is not None:
+            value = round(value, self.suggested_display_precision)
+        return (self.available, value, self.extra_state_attributes)
+
+    @property
+    def extra_state_attributes(self):
+        """Forecast of the sensor's value for the rest of the heating profile."""
+        if not self._forecast or self.coordinator.profile is None:
+            return None
+        return {
+            "forecast": self.coordinator.profile.forecast(
+                self._lambda_measurement, dt_util.utcnow()
+            )
+        }
+
     @property
     def state_class(self):
         """Type of state.
@@ -186,3 +305,100 @@ class OptisparkSensorParameter(OptisparkSensor):
             return getattr(self.coordinator, self._coordinator_parameter)
         else:
             return None
+
+
+class OptisparkAccumulatorSensor(OptisparkSensor, RestoreSensor):
+    """Running total of a rate, reset at the start of every day, week or month.
+
+    The rate is integrated with the trapezoidal rule on each coordinator update, so every update
+    only adds one segment to the total.  Segments longer than const.ACCUMULATOR_MAX_GAP seconds,
+    such as when Home Assistant was stopped, are not counted.  The total is restored after a
+    restart if it belongs to the current period.
+    """
+
+    def __init__(
+        self,
+        coordinator: OptisparkDataUpdateCoordinator,
+        entity_description: SensorEntityDescription,
+        rate,
+        period: str,
+        device_class: str = None,
+        native_unit_of_measurement: str = None,
+        suggested_display_precision: int = None,
+    ) -> None:
+        """Initialize the sensor class.
+
+        rate is called with the coordinator and returns the rate in native_unit_of_measurement per
+        hour.
+        """
+        super().__init__(
+            coordinator=coordinator,
+            entity_description=entity_description,
+            lambda_measurement=None,
+            device_class=device_class,
+            native_unit_of_measurement=native_unit_of_measurement,
+            suggested_display_precision=suggested_display_precision,
+            state_class=SensorStateClass.TOTAL,
+        )
+        self._rate = rate
+        self._period = period
+        self._total = 0.0
+        self._attr_last_reset = None
+        self._last_time = None
+        self._last_rate = None
+
+    async def async_added_to_hass(self) -> None:
+        """Restore the total of the current period."""
+        await super().async_added_to_hass()
+        last_state = await self.async_get_last_state()
+        last_sensor_data = await self.async_get_last_sensor_data()
+        if last_state is None or last_sensor_data is None:
+            return
+        if (last_reset := last_state.attributes.get("last_reset")) is None:
+            return
+        last_reset = dt_util.parse_datetime(last_reset)
+        if last_reset != period_start(dt_util.now(), self._period):
+            return
+        if last_sensor_data.native_value is not None:
+            self._total = float(last_sensor_data.native_value)
+            self._attr_last_reset = last_reset
+
+    def _current_rate(self):
+        """Rate from the coordinator, None if it isn't available."""
+        if not self.coordinator.available or self.coordinator.data is None:
+            return None
+        try:
+            return self._rate(self.coordinator)
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.debug(f"({self.entity_description.key}) rate not available: {err}")
+            return None
+
+    def accumulate(self, now):
+        """Add the segment since the previous update to the total."""
+        start = period_start(now, self._period)
+        if self._attr_last_reset != start:
+            self._total = 0.0
+            self._attr_last_reset = start
+        rate = self._current_rate()
+        if rate is not None and self._last_rate is not None:
+            hours = (now - self._last_time).total_seconds() / 3600
+            if 0 < hours <= const.ACCUMULATOR_MAX_GAP / 3600:
+                self._total += (rate + self._last_rate) / 2 * hours
+        self._last_time = now
+        self._last_rate = rate
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Accumulate on every update, the state is only written if the rounded total changes."""
+        self.accumulate(dt_util.now())
+        super()._handle_coordinator_update()
+
+    @property
+    def native_value(self) -> float:
+        """Total since the start of the period."""
+        return self._total
+
+    @property
+    def last_reset(self):
+        """Start of the current period."""
+        return self._attr_last_reset
@@ -0,0 +1,193 @@
+"""Export the heating profile to Home Assistant long-term statistics.
+
+Each new profile is imported as hourly external statistics, so the plan can be shown by the
+history graphs and the Energy dashboard without writing the sensor states every update.
+Hours that are already in the statistics are overwritten by the newer profile.
+Powers and prices are exported with a mean, min and max.  Costs are exported as hourly totals
+with a cumulative sum, which is what the Energy dashboard uses.  The sums are continued from the
+last export, which StatisticsExporter keeps in memory.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+import asyncio
+
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    statistics_during_period,
+)
+from homeassistant.components.recorder.util import get_instance
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+import numpy as np
+
+from . import const
+from .const import LOGGER
+from .profile import ProfileIndex
+
+SECONDS_PER_HOUR = 60 * 60
+# How far back to look for the cumulative sum that a cost export continues from
+SUM_LOOKBACK = timedelta(days=7)
+
+
+def hourly_statistics(timestamps: np.ndarray, values: np.ndarray, total: bool):
+    """Mean, min and max of values in each hour.
+
+    If total is set the values are amounts for each time step, such as a cost, and the mean, min
+    and max are all the total for the hour, only the first is meaningful.
+    Returns the start of each hour (seconds since the epoch) and the three statistics.
+    NaN values are ignored.
+    """
+    keep = ~np.isnan(values)
+    timestamps, values = timestamps[keep], values[keep]
+    if len(values) == 0:
+        return (np.array([]),) * 4
+    hours = np.floor(timestamps / SECONDS_PER_HOUR) * SECONDS_PER_HOUR
+    starts, first = np.unique(hours, return_index=True)
+    sums = np.add.reduceat(values, first)
+    if total:
+        return starts, sums, sums, sums
+    counts = np.diff(np.append(first, len(values)))
+    return (
+        starts,
+        sums / counts,
+        np.minimum.reduceat(values, first),
+        np.maximum.reduceat(values, first),
+    )
+
+
+def step_hours(timestamps: np.ndarray) -> np.ndarray:
+    """Length of each profile time step in hours, the last step is as long as the one before it."""
+    if len(timestamps) < 2:
+        return np.ones(len(timestamps))
+    durations = np.diff(timestamps)
+    return np.append(durations, durations[-1]) / SECONDS_PER_HOUR
+
+
+def profile_series(profile: ProfileIndex) -> dict[str, tuple[str, str, np.ndarray, bool]]:
+    """{statistic key: (name, unit, values for each time step, total)} exported for profile.
+
+    The costs are the energy of each time step multiplied by its price, they are totalled for
+    each hour.
+    """
+    price = profile.series(const.LAMBDA_PRICE)
+    optimised_demand = profile.series(const.LAMBDA_OPTIMISED_DEMAND)
+    base_demand = profile.series(const.LAMBDA_BASE_DEMAND)
+    hours = step_hours(profile.timestamps)
+    return {
+        "plan_optimised_demand": ("Optimised demand plan", "kW", optimised_demand, False),
+        "plan_base_demand": ("Base demand plan", "kW", base_demand, False),
+        "plan_price": ("Electricity price plan", "p/kWh", price, False),
+        "plan_optimised_cost": (
+            "Optimised cost plan", "p", optimised_demand * hours * price, True
+        ),
+        "plan_base_cost": ("Base cost plan", "p", base_demand * hours * price, True),
+    }
+
+
+class StatisticsExporter:
+    """Exports each new heating profile, keeping the cost sums of the last export in memory.
+
+    The recorder queues imports, so the sums a profile continues from are taken from the last
+    export rather than read back from the recorder.  Exports are run one at a time.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Init."""
+        self.hass = hass
+        self._lock = asyncio.Lock()
+        # {statistic_id: (hour starts, cumulative sums)} last exported for each cost
+        self._sums: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    async def _async_sums_before(self, statistic_id: str, start: float):
+        """Hour starts and cumulative sums of statistic_id from before start onwards.
+
+        Taken from the last export if it has an hour before start, otherwise read from the
+        recorder, searching the SUM_LOOKBACK before start.
+        """
+        if (previous := self._sums.get(statistic_id)) is not None and (
+            len(previous[0]) and previous[0][0] < start
+        ):
+            return previous
+        statistics = await get_instance(self.hass).async_add_executor_job(
+            statistics_during_period,
+            self.hass,
+            dt_util.utc_from_timestamp(start) - SUM_LOOKBACK,
+            None,
+            {statistic_id},
+            "hour",
+            None,
+            {"sum"},
+        )
+        rows = [row for row in statistics.get(statistic_id, []) if row.get("sum") is not None]
+        return (
+            np.array([row["start"] for row in rows], dtype=np.float64),
+            np.array([row["sum"] for row in rows], dtype=np.float64),
+        )
+
+    async def _async_total_statistics(self, statistic_id: str, starts, totals):
+        """Rows of a cost, continuing the cumulative sum of the hours before the profile.
+
+        Hours that were exported after the end of the profile, by a longer profile, are
+        overwritten with a total of 0 so the sum never goes back down.
+        """
+        previous_starts, previous_sums = await self._async_sums_before(statistic_id, starts[0])
+        before = previous_starts < starts[0]
+        base = previous_sums[before][-1] if before.any() else 0.0
+        after = previous_starts > starts[-1]
+        starts = np.concatenate([starts, previous_starts[after]])
+        totals = np.concatenate([totals, np.zeros(after.sum())])
+        sums = base + np.cumsum(totals)
+        self._sums[statistic_id] = (starts, sums)
+        return [
+            {
+                "start": dt_util.utc_from_timestamp(start),
+                "state": state,
+                "sum": cumulative,
+            }
+            for start, state, cumulative in zip(starts.tolist(), totals.tolist(), sums.tolist())
+        ]
+
+    async def async_export_profile(self, profile: ProfileIndex):
+        """Import the hourly series of profile into the long-term statistics.
+
+        The imports are queued with the recorder, nothing is written if it isn't loaded.  The
+        costs continue the cumulative sum of the hours before the profile, the hours they
+        overwrite are replaced.
+        """
+        if "recorder" not in self.hass.config.components:
+            return
+        async with self._lock:
+            for key, (name, unit, values, total) in profile_series(profile).items():
+                starts, means, minimums, maximums = hourly_statistics(
+                    profile.timestamps, values, total
+                )
+                if len(starts) == 0:
+                    continue
+                statistic_id = f"{const.DOMAIN}:{key}"
+                metadata = {
+                    "has_mean": not total,
+                    "has_sum": total,
+                    "name": f"{const.NAME} {name}",
+                    "source": const.DOMAIN,
+                    "statistic_id": statistic_id,
+                    "unit_of_measurement": unit,
+                }
+                if total:
+                    statistics = await self._async_total_statistics(statistic_id, starts, means)
+                else:
+                    statistics = [
+                        {
+                            "start": dt_util.utc_from_timestamp(start),
+                            "mean": mean,
+                            "min": minimum,
+                            "max": maximum,
+                        }
+                        for start, mean, minimum, maximum in zip(
+                            starts.tolist(), means.tolist(), minimums.tolist(), maximums.tolist()
+                        )
+                    ]
+                async_add_external_statistics(self.hass, metadata, statistics)
+        LOGGER.debug(
+            f"Heating profile exported to statistics ({len(profile.timestamps)} time steps)"
+        )
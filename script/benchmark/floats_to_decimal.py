@@ -0,0 +1,105 @@
+"""Benchmark api.floats_to_decimal against the previous recursive implementation.
+
+Run from the repository root with a Home Assistant development environment:
+    python -m script.benchmark.floats_to_decimal
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import random
+import sys
+import timeit
+
+from custom_components.optispark.api import floats_to_decimal
+
+
+def recursive_floats_to_decimal(obj):
+    """Previous implementation, kept for comparison (tuple branch fixed so results match)."""
+    if isinstance(obj, float):
+        return Decimal(str(obj))
+    elif isinstance(obj, int):
+        return obj
+    elif isinstance(obj, str):
+        return obj
+    elif obj is None:
+        return None
+    elif isinstance(obj, dict):
+        return {
+            recursive_floats_to_decimal(key): recursive_floats_to_decimal(value)
+            for key, value in obj.items()
+        }
+    elif isinstance(obj, set):
+        return {recursive_floats_to_decimal(element) for element in obj}
+    elif isinstance(obj, list):
+        return [recursive_floats_to_decimal(element) for element in obj]
+    elif isinstance(obj, tuple):
+        return tuple(recursive_floats_to_decimal(element) for element in obj)
+    elif isinstance(obj, datetime):
+        return recursive_floats_to_decimal(obj.timestamp())
+    raise TypeError(f"Object of type {type(obj)} not supported by DynamoDB")
+
+
+def upload_chunk(readings):
+    """History shaped like a MAX_UPLOAD_HISTORY_READINGS upload chunk in the legacy format."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    climate = {
+        start + timedelta(seconds=30 * idx): {
+            "state": "heat",
+            "attributes": {
+                "current_temperature": random.uniform(15, 25),
+                "temperature": random.uniform(18, 22),
+                "target_temp_high": None,
+                "target_temp_low": None,
+                "hvac_modes": ["off", "heat"],
+            },
+        }
+        for idx in range(readings)
+    }
+    power = {
+        start + timedelta(seconds=30 * idx): {"state": random.uniform(0, 3), "attributes": {}}
+        for idx in range(readings)
+    }
+    return {
+        "histories": {"climate_entity": climate, "heat_pump_power": power},
+        "user_hash": "benchmark",
+    }
+
+
+def deep_list(depth):
+    """A list nested depth times."""
+    obj = [1.5]
+    for _ in range(depth):
+        obj = [obj]
+    return obj
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = upload_chunk(args.readings)
+    assert floats_to_decimal(payload) == recursive_floats_to_decimal(payload)
+    for name, function in (
+        ("recursive", recursive_floats_to_decimal),
+        ("iterative", floats_to_decimal),
+    ):
+        best = min(timeit.repeat(lambda: function(payload), number=1, repeat=args.repeat))
+        print(f"{name:>10}: {best * 1000:8.1f} ms for {args.readings} readings")  # noqa: T201
+
+    depth = sys.getrecursionlimit() * 2
+    try:
+        recursive_floats_to_decimal(deep_list(depth))
+        print(f" recursive: handled nesting depth {depth}")  # noqa: T201
+    except RecursionError:
+        print(f" recursive: RecursionError at nesting depth {depth}")  # noqa: T201
+    floats_to_decimal(deep_list(depth))
+    print(f" iterative: handled nesting depth {depth}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
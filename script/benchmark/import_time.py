@@ -0,0 +1,87 @@
+"""Check the import cost of the Optispark integration with python -X importtime.
+
+Each module is imported in a fresh interpreter, after the Home Assistant modules that are always
+loaded, so only the integration's own import cost is measured.  Fails if a module takes longer
+than its budget or imports one of its forbidden heavy dependencies.
+
+Run from the repository root with a Home Assistant development environment:
+    python -m script.benchmark.import_time
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import subprocess
+import sys
+
+# Imported first, Home Assistant has already loaded them before the integration (jwt is used
+# by Home Assistant's auth)
+PRELOADED = ["homeassistant.core", "homeassistant.helpers.update_coordinator", "jwt"]
+
+# {module: (budget in ms, top level packages it mustn't import)}
+MODULES = {
+    "custom_components.optispark": (150, {"numpy", "geopy"}),
+    "custom_components.optispark.config_flow": (150, {"numpy", "geopy"}),
+    # The platforms need numpy for the heating profile
+    "custom_components.optispark.coordinator": (600, set()),
+}
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(module: str) -> list[tuple[str, int, int]]:
+    """(module, self us, cumulative us) of every module imported by module, in import order."""
+    code = "; ".join(f"import {name}" for name in [*PRELOADED, module])
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, _indent, name = match.groups()
+        times.append((name, int(self_us), int(cumulative_us)))
+    # Only keep what was imported after the preloaded modules
+    last_preloaded = max(
+        idx for idx, (name, _, _) in enumerate(times) if name in PRELOADED
+    )
+    return times[last_preloaded + 1:]
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="heaviest imports to list")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply the budgets for slower machines"
+    )
+    args = parser.parse_args()
+
+    failures = []
+    for module, (budget_ms, forbidden) in MODULES.items():
+        runs = [import_times(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda times: sum(self_us for _, self_us, _ in times))
+        total_ms = sum(self_us for _, self_us, _ in best) / 1000
+        budget_ms *= args.scale
+        print(f"{module}: {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")  # noqa: T201
+        for name, self_us, _ in sorted(best, key=lambda time: -time[1])[:args.top]:
+            print(f"  {self_us / 1000:8.1f} ms  {name}")  # noqa: T201
+
+        if total_ms > budget_ms:
+            failures.append(f"{module} took {total_ms:.1f} ms, over its {budget_ms:.0f} ms budget")
+        imported = {name.split(".")[0] for name, _, _ in best}
+        for package in sorted(forbidden & imported):
+            failures.append(f"{module} imports {package}, it should be imported on first use")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")  # noqa: T201
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()